@@ -0,0 +1,162 @@
+import os
+import json
+import time
+import shutil
+import threading
+from collections import OrderedDict
+
+# .part files of interrupted downloads are resumed if they are younger than this
+PARTIAL_MAX_AGE = 7 * 24 * 3600
+
+
+class AudioCache:
+    # persistent audio files keyed by video ID, evicted least recently used first
+    def __init__(self, cache_dir="cache", max_bytes=2 * 1024 ** 3, max_entries=1000):
+        self.cache_dir = cache_dir
+        self.partial_dir = os.path.join(cache_dir, ".partial")
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.lock = threading.RLock()
+        self.entries = OrderedDict()  # ID -> {"file", "size", "last_used"}, oldest first
+        self.in_flight = {}  # ID -> threading.Event of the download currently running
+        self.total_bytes = 0
+        self.dirty = False  # last_used changed since the index was saved
+
+        if not os.path.exists(self.partial_dir):
+            os.makedirs(self.partial_dir)
+            print("found no cache folder, creating...")
+        self.load_index()
+
+    def load_index(self):
+        entries = []
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, 'r', encoding='utf-8') as f:
+                    entries = json.load(f)["entries"]
+            except (ValueError, KeyError):
+                print("cache index is broken, rebuilding...")
+        entries.sort(key=lambda e: e["last_used"])
+        for entry in entries:
+            # drop entries whose file was removed behind our back
+            if os.path.exists(os.path.join(self.cache_dir, entry["file"])):
+                self.entries[entry["ID"]] = {"file": entry["file"], "size": entry["size"],
+                                             "last_used": entry["last_used"]}
+                self.total_bytes += entry["size"]
+
+        # interrupted transfers (.part, and .ytdl for fragmented ones) are picked up again by the
+        # next download of the same ID, anything else left there was not finished
+        now = time.time()
+        for fn in os.listdir(self.partial_dir):
+            path = os.path.join(self.partial_dir, fn)
+            resumable = '.part' in fn or fn.endswith('.ytdl')
+            if not resumable or os.path.getmtime(path) + PARTIAL_MAX_AGE < now:
+                os.remove(path)
+
+    def save_index(self):
+        # under the lock, two downloads finishing together would share the tmp file otherwise
+        with self.lock:
+            data = {"entries": [{"ID": ID, **entry} for ID, entry in self.entries.items()]}
+            tmp_path = self.index_path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.index_path)
+            self.dirty = False
+
+    def flush(self):
+        # saves the play order get() keeps in memory, so eviction after a restart follows it
+        if self.dirty:
+            self.save_index()
+
+    def contains(self, ID):
+        with self.lock:
+            return ID in self.entries
+
+    def get(self, ID):
+        # returns the cached file path and marks it as recently used, or None
+        with self.lock:
+            entry = self.entries.get(ID)
+            if entry is None:
+                return None
+            entry["last_used"] = time.time()
+            self.entries.move_to_end(ID)
+            self.dirty = True
+            return os.path.join(self.cache_dir, entry["file"])
+
+    def path(self, ID):
+        # like get() but without counting as a use
+        with self.lock:
+            entry = self.entries.get(ID)
+            return None if entry is None else os.path.join(self.cache_dir, entry["file"])
+
+    def fetch(self, ID, download_func):
+        # download_func(ID, target_dir) downloads into target_dir and returns the file path.
+        # concurrent fetches of the same ID share one download
+        while True:
+            with self.lock:
+                path = self.get(ID)
+                if path is not None:
+                    return path
+                event = self.in_flight.get(ID)
+                if event is None:
+                    event = threading.Event()
+                    self.in_flight[ID] = event
+                    break
+            # if the shared download fails or is cancelled the next loop starts our own
+            event.wait()
+
+        try:
+            partial_path = download_func(ID, self.partial_dir)
+            return self.put(ID, partial_path)
+        finally:
+            with self.lock:
+                del self.in_flight[ID]
+            event.set()
+
+    def put(self, ID, file_path):
+        # moves a finished file into the cache, replacing is atomic on the same filesystem
+        file_name = ID + os.path.splitext(file_path)[1]
+        target = os.path.join(self.cache_dir, file_name)
+        if os.path.dirname(os.path.abspath(file_path)) == os.path.abspath(self.partial_dir):
+            os.replace(file_path, target)
+        else:
+            shutil.copyfile(file_path, target + ".tmp")
+            os.replace(target + ".tmp", target)
+        size = os.path.getsize(target)
+
+        with self.lock:
+            old = self.entries.pop(ID, None)
+            if old is not None:
+                self.total_bytes -= old["size"]
+                if old["file"] != file_name:
+                    self._remove_file(old["file"])
+            self.entries[ID] = {"file": file_name, "size": size, "last_used": time.time()}
+            self.total_bytes += size
+            self.evict(keep=ID)
+        self.save_index()
+        return target
+
+    def evict(self, keep=None):
+        with self.lock:
+            for ID in list(self.entries):
+                if self.total_bytes <= self.max_bytes and len(self.entries) <= self.max_entries:
+                    break
+                if ID == keep:
+                    continue
+                self.remove(ID, save=False)
+
+    def remove(self, ID, save=True):
+        with self.lock:
+            entry = self.entries.pop(ID, None)
+            if entry is None:
+                return
+            self.total_bytes -= entry["size"]
+            self._remove_file(entry["file"])
+        if save:
+            self.save_index()
+
+    def _remove_file(self, file_name):
+        try:
+            os.remove(os.path.join(self.cache_dir, file_name))
+        except FileNotFoundError:
+            pass
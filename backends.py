@@ -0,0 +1,200 @@
+import os
+import time
+import struct
+
+from metadata import MetadataCache, warm_up
+from metrics import metrics
+from track import Track
+
+
+class SongUnavailable(Exception):
+    # the song is gone for good (deleted, private, blocked), unlike network errors
+    pass
+
+
+class Backend:
+    # where songs come from. all methods may be called from worker threads
+    def iter_songs(self, url):
+        # yields (is_playlist, [Track, ...]) batches
+        raise NotImplementedError
+
+    def stream_url(self, ID):
+        # a url QMediaPlayer can start playing before the download is done
+        raise NotImplementedError
+
+    def download(self, ID, target_dir, progress=None, rate_limit=None):
+        # downloads into target_dir and returns the file path. progress gets yt-dlp style dicts,
+        # rate_limit is in bytes per second. an ID.<ext>.part left in target_dir is resumed
+        raise NotImplementedError
+
+    def check(self, ID):
+        # fresh {"name", "duration"} of ID, raises SongUnavailable when it can not be played anymore
+        raise NotImplementedError
+
+    def warm_up(self):
+        pass
+
+    def flush(self):
+        # writes what was learned about songs since the last call
+        pass
+
+    def streams(self):
+        # whether stream_url gives something playable
+        return False
+
+
+class YoutubeBackend(Backend):
+    def __init__(self, config):
+        self.config = config
+        self.metadata = MetadataCache(os.path.join(config["cache_dir"], "metadata.json"),
+                                      config["metadata_ttl"], self.audio_format())
+
+    def audio_format(self):
+        if self.config["audio_mode"] == "mp3":
+            return 'bestaudio'
+        # prefer a container QMediaPlayer decodes as is
+        return '/'.join(f'bestaudio[ext={ext}]' for ext in self.config["playable_formats"]) + '/bestaudio'
+
+    def iter_songs(self, url):
+        return self.metadata.iter_songs(url)
+
+    def stream_url(self, ID):
+        return self.metadata.resolve(ID, need_streams=True)['url']
+
+    def streams(self):
+        return self.config["audio_mode"] != "mp3"
+
+    def flush(self):
+        self.metadata.flush()
+
+    def download(self, ID, target_dir, progress=None, rate_limit=None):
+        from yt_dlp import YoutubeDL  # yt-dlp docs: https://github.com/yt-dlp/yt-dlp/blob/c54ddfba0f7d68034339426223d75373c5fc86df/yt_dlp/YoutubeDL.py#L457
+        ydl_opts = {'outtmpl': os.path.join(target_dir, f'{ID}.%(ext)s'), 'format': self.audio_format()}
+        if self.config["audio_mode"] == "mp3":
+            ydl_opts['postprocessors'] = [{
+                'key': 'FFmpegVideoConvertor',
+                'preferedformat': 'mp3'
+            }]
+        else:
+            # only remux (no re-encoding) when none of the playable containers was offered
+            playable = self.config["playable_formats"]
+            ydl_opts['postprocessors'] = [{
+                'key': 'FFmpegVideoRemuxer',
+                'preferedformat': '/'.join(f'{ext}>{ext}' for ext in playable) + '/m4a'
+            }]
+        started = []
+
+        def timing(d):
+            # download is the transfer alone, postprocess the remux or conversion after it
+            if not started:
+                started.append(time.perf_counter())
+            if d.get('status') == 'finished':
+                metrics.record("download", time.perf_counter() - started[0])
+            if progress is not None:
+                progress(d)
+
+        def postprocess_timing(d):
+            if d.get('status') == 'started':
+                metrics.start("postprocess", ID)
+            elif d.get('status') == 'finished':
+                metrics.finish("postprocess", ID)
+
+        if rate_limit:
+            ydl_opts['ratelimit'] = rate_limit
+        ydl_opts['progress_hooks'] = [timing]
+        ydl_opts['postprocessor_hooks'] = [postprocess_timing]
+        with YoutubeDL(ydl_opts) as ydl:
+            # reuses what was resolved when the song was queued instead of extracting again
+            info_dict = ydl.process_ie_result(self.metadata.info_for_download(ID), download=True)
+        # the real file name after postprocessing, its extension is whatever we ended up with
+        return info_dict['requested_downloads'][0]['filepath']
+
+    def check(self, ID):
+        from yt_dlp.utils import DownloadError, ExtractorError
+        try:
+            info = self.metadata.check(ID)
+        except DownloadError as e:
+            # yt-dlp marks errors about the video itself as expected, network trouble is not
+            cause = e.exc_info[1] if e.exc_info else None
+            if isinstance(cause, ExtractorError) and cause.expected:
+                raise SongUnavailable(str(e)) from e
+            raise
+        return {"name": info['title'], "duration": info['duration']}
+
+    def warm_up(self):
+        warm_up()
+
+
+class FakeBackend(Backend):
+    # serves silent wav files with a set latency and bandwidth, for working and benchmarking offline.
+    # "fake://playlist/<n>" lists n songs, any other url or ID is a single song
+    def __init__(self, latency=0.05, bandwidth=4 * 1024 ** 2, song_seconds=180, byte_rate=16000,
+                 batch_size=50):
+        self.latency = latency  # seconds before anything arrives
+        self.bandwidth = bandwidth  # bytes per second
+        self.song_seconds = song_seconds
+        self.byte_rate = byte_rate  # 8 bit mono, so also the sample rate
+        self.batch_size = batch_size
+        self.downloads = 0  # download() calls, the benchmarks tell cache hits from misses by it
+
+    def iter_songs(self, url):
+        time.sleep(self.latency)
+        if url.startswith("fake://playlist/"):
+            count = int(url.rsplit('/', 1)[1])
+            for first in range(0, count, self.batch_size):
+                yield True, [Track(f"fake song fake{i:07d}", f"fake{i:07d}")
+                             for i in range(first, min(count, first + self.batch_size))]
+        else:
+            ID = url.rsplit('/', 1)[-1]
+            yield False, [Track(f"fake song {ID}", ID)]
+
+    def stream_url(self, ID):
+        time.sleep(self.latency)
+        return f"fake://stream/{ID}"
+
+    def check(self, ID):
+        # IDs starting with "dead" are unavailable
+        time.sleep(self.latency)
+        if ID.startswith("dead"):
+            raise SongUnavailable(f"{ID} is not available")
+        return {"name": f"fake song {ID}", "duration": self.song_seconds}
+
+    def download(self, ID, target_dir, progress=None, rate_limit=None):
+        self.downloads += 1
+        time.sleep(self.latency)
+        data_size = self.song_seconds * self.byte_rate
+        path = os.path.join(target_dir, f"{ID}.wav")
+        bandwidth = min(self.bandwidth, rate_limit) if rate_limit else self.bandwidth
+        info_dict = {"id": ID, "duration": self.song_seconds}
+        chunk = 64 * 1024
+        start = time.perf_counter()
+        # like yt-dlp, writes to .part and carries on from what an interrupted download left there
+        with open(path + ".part", 'ab') as f:
+            if f.tell() < 44:
+                f.truncate(0)
+                f.write(self.wav_header(data_size))
+            written = f.tell() - 44
+            while written < data_size:
+                n = min(chunk, data_size - written)
+                f.write(b'\x80' * n)  # silence
+                written += n
+                time.sleep(n / bandwidth)
+                if progress is not None:
+                    progress({"status": "downloading", "downloaded_bytes": written, "total_bytes": data_size,
+                              "elapsed": time.perf_counter() - start, "info_dict": info_dict})
+        if progress is not None:
+            progress({"status": "finished", "downloaded_bytes": data_size, "total_bytes": data_size,
+                      "elapsed": time.perf_counter() - start, "info_dict": info_dict})
+        os.replace(path + ".part", path)
+        return path
+
+    def wav_header(self, data_size):
+        return (b'RIFF' + struct.pack('<I', 36 + data_size) + b'WAVE'
+                + b'fmt ' + struct.pack('<IHHIIHH', 16, 1, 1, self.byte_rate, self.byte_rate, 1, 8)
+                + b'data' + struct.pack('<I', data_size))
+
+
+def make_backend(config):
+    if config["backend"] == "fake":
+        return FakeBackend(**config["fake_backend"])
+    return YoutubeBackend(config)
@@ -0,0 +1,431 @@
+# offline benchmarks of the player core, no display and no network needed. every round checks what it
+# got back as well, a wrong result stops the run with an AssertionError:
+#   python benchmark.py            all of them
+#   python benchmark.py queue      only the ones whose name contains "queue"
+import os
+import sys
+import time
+import shutil
+import sqlite3
+import tempfile
+import threading
+import statistics
+import tracemalloc
+
+from config import DEFAULTS
+from engine import Engine
+from audio_cache import AudioCache
+from backends import FakeBackend
+from track_queue import TrackQueue
+from playlist_store import PlaylistStore
+from session import Session
+from metrics import metrics
+from search import TitleIndex
+from track import Track
+
+N = 10000
+
+
+def songs(n):
+    return [Track(f"song {i}", f"id{i:07d}") for i in range(n)]
+
+
+def ids(n):
+    return [f"id{i:07d}" for i in range(n)]
+
+
+def expect(ok, what):
+    # like assert, but also under python -O
+    if not ok:
+        raise AssertionError(what)
+
+
+def bench(name, func, setup=None, rounds=5, check=None):
+    # runs setup() untimed before every round, func gets what it returned.
+    # check(state, result) runs untimed after every round and raises when the result is wrong
+    times = []
+    for _ in range(rounds):
+        state = setup() if setup is not None else None
+        start = time.perf_counter()
+        result = func(state)
+        times.append(time.perf_counter() - start)
+        if check is not None:
+            check(state, result)
+    print(f"{name:<40}min {min(times) * 1000:9.3f} ms   median {statistics.median(times) * 1000:9.3f} ms")
+
+
+class Sandbox:
+    # an engine on a temp dir with the fake backend, so every round starts from an empty cache
+    def __init__(self, **backend):
+        self.dir = tempfile.mkdtemp(prefix="player-bench-")
+        config = dict(DEFAULTS, cache_dir=f"{self.dir}/cache", library_db=f"{self.dir}/library.db",
+                      local_index=f"{self.dir}/local.db", session_file=f"{self.dir}/session.json", legacy_playlist="")
+        self.engine = Engine(config, FakeBackend(**backend))
+
+    def close(self):
+        self.engine.playlist_store.db.close()
+        self.engine.local.db.close()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+def first_audio(engine):
+    # what Playback.load_and_play gets the queue head's audio with, minus the players:
+    # the file if it is cached or local, otherwise the download its PLAY_NOW job runs
+    ID = engine.queue[0].ID
+    return engine.audio_path(ID) or engine.fetch_audio(ID)
+
+
+def skip(engine):
+    # Playback.next_song
+    engine.skip()
+    return first_audio(engine)
+
+
+def plays(ID, downloads):
+    # the file returned is ID's in the cache, and the backend was asked for downloads songs in all
+    def check(engine, path):
+        expect(engine.queue[0].ID == ID, f"{engine.queue[0].ID} is first in the queue, not {ID}")
+        expect(path == engine.cache.path(ID) and os.path.exists(path), f"{path} is not the cached file of {ID}")
+        expect(engine.backend.downloads == downloads,
+               f"{engine.backend.downloads} downloads, {downloads} expected")
+    return check
+
+
+def playback_benchmarks():
+    backend = {"latency": 0.02, "bandwidth": 64 * 1024 ** 2, "song_seconds": 30}
+    boxes = []
+
+    def fresh():
+        box = Sandbox(**backend)
+        boxes.append(box)
+        box.engine.enqueue("fake://playlist/20")
+        return box.engine
+
+    def cached():
+        engine = fresh()
+        first_audio(engine)
+        return engine
+
+    def cached_next():
+        engine = cached()
+        engine.fetch_audio(engine.queue[1].ID)
+        return engine
+
+    bench("time to first audio, cold", first_audio, fresh, check=plays("fake0000000", 1))
+    bench("time to first audio, cache hit", first_audio, cached, check=plays("fake0000000", 1))
+    bench("skip, next song not downloaded", skip, cached, check=plays("fake0000001", 2))
+    bench("skip, next song prefetched", skip, cached_next, check=plays("fake0000001", 2))
+    bench("list a 1000 song playlist", lambda engine: engine.get_songs("fake://playlist/1000", lambda batch: None),
+          fresh, check=lambda engine, count: expect(count == 1000, f"{count} songs listed"))
+    for box in boxes:
+        box.close()
+
+
+def queue_benchmarks():
+    def full():
+        queue = TrackQueue()
+        queue.extend(songs(N))
+        return queue
+
+    def pop_all(queue):
+        while len(queue) > 0:
+            queue.pop_front()
+
+    def push_front(queue):
+        for song in songs(1000):
+            queue.push_front(song)
+
+    def lookups(queue):
+        return sum(queue.contains(f"id{i:07d}") for i in range(0, N, 10))
+
+    def twice():
+        queue = full()
+        queue.extend(songs(N))
+        return queue
+
+    def copies():
+        queue = full()
+        queue.extend([Track("again", "id0000005")] * 9)
+        return queue
+
+    def in_order(expected):
+        def check(queue, _):
+            expect([song.ID for song in queue] == expected, "the queue is not in the expected order")
+        return check
+
+    def shuffled(queue, _):
+        expect(queue[0].ID == "id0000000", "shuffle moved the playing song")
+        expect(sorted(song.ID for song in queue) == ids(N), "shuffle lost or added songs")
+
+    def popped(queue, _):
+        expect(len(queue) == 0 and queue.history[-1].ID == ids(N)[-1], "pop_front left songs or lost the history")
+
+    bench(f"queue extend {N}", lambda queue: queue.extend(songs(N)), TrackQueue, check=in_order(ids(N)))
+    bench(f"queue pop_front x{N}", pop_all, full, check=popped)
+    bench("queue push_front x1000", push_front, full, check=in_order(ids(1000)[::-1] + ids(N)))
+    bench(f"queue contains x{N // 10}", lookups, full,
+          check=lambda queue, found: expect(found == N // 10, f"{found} of {N // 10} found"))
+    bench("queue move first to last", lambda queue: queue.move(0, N - 1), full,
+          check=in_order(ids(N)[1:] + ids(1)))
+    bench("queue remove_id, 10 copies", lambda queue: queue.remove_id("id0000005"), copies,
+          check=in_order([ID for ID in ids(N) if ID != "id0000005"]))
+    bench(f"queue shuffle {N}", lambda queue: queue.shuffle(), full, check=shuffled)
+    bench(f"queue dedupe {2 * N}", lambda queue: queue.dedupe(), twice, check=in_order(ids(N)))
+
+
+def playlist_benchmarks():
+    boxes = []
+
+    def empty():
+        box = Sandbox()
+        boxes.append(box)
+        return box.engine.playlist_store
+
+    def full():
+        store = empty()
+        store.append(songs(N))
+        return store
+
+    def reopen():
+        store = full()
+        path = store.db.execute("PRAGMA database_list").fetchone()[2]
+        store.db.close()
+        return path
+
+    def legacy():
+        # a library from before there were several playlists, the first open migrates it
+        box = Sandbox()
+        boxes.append(box)
+        path = f"{box.dir}/legacy.db"
+        db = sqlite3.connect(path)
+        with db:
+            db.execute("CREATE TABLE songs (row_id INTEGER PRIMARY KEY, ID TEXT NOT NULL, name TEXT, rank REAL NOT NULL)")
+            db.execute("CREATE INDEX songs_rank ON songs (rank)")
+            db.executemany("INSERT INTO songs (ID, name, rank) VALUES (?, ?, ?)",
+                           ((song.ID, song.name, i) for i, song in enumerate(songs(N))))
+        db.close()
+        return path
+
+    def open_count(path):
+        store = PlaylistStore(path, legacy_json="")
+        count = store.count()
+        store.db.close()
+        return count
+
+    def migrated(path, count):
+        expect(count == N, f"{count} songs after opening")
+        store = PlaylistStore(path, legacy_json="")
+        expect(store.playlists() == [(1, "playlist", N)], f"manifest is {store.playlists()}")
+        expect([song.ID for song in store.load()] == ids(N), "the songs are not in their old order")
+        store.db.close()
+
+    def many():
+        # 20 playlists of N songs
+        store = empty()
+        for i in range(20):
+            store.append(songs(N), store.create_playlist(f"playlist {i}"))
+        path = store.db.execute("PRAGMA database_list").fetchone()[2]
+        store.db.close()
+        return path
+
+    def open_one(path):
+        store = PlaylistStore(path, legacy_json="")
+        playlist = store.playlist(store.playlists()[-1][0])
+        playlist.count()
+        page = playlist.load(0, 200)
+        store.db.close()
+        return page
+
+    def moves(store):
+        rows = store.load(0, 100)
+        for row in rows:
+            store.move(row.rowid, rows[-1].rowid)
+
+    def moved(store, _):
+        # every one of the first 100 went right after the 100th, which stays where it is
+        expected = ids(N)
+        last = expected[99]
+        for ID in ids(99):
+            expected.remove(ID)
+            expected.insert(expected.index(last) + 1, ID)
+        expect([song.ID for song in store.load()] == expected, "moves left the playlist in the wrong order")
+
+    def listed(expected):
+        def check(_, songs):
+            expect([song.ID for song in songs] == expected, "the songs are not in rank order")
+        return check
+
+    bench(f"playlist save {N}", lambda store: store.append(songs(N)), empty,
+          check=lambda store, added: expect(store.count() == N and len(added) == N, f"{store.count()} songs saved"))
+    bench(f"playlist load {N}", lambda store: store.load(), full, check=listed(ids(N)))
+    bench("playlist load first page", lambda store: store.load(0, 200), full, check=listed(ids(200)))
+    bench(f"playlist open {N}", open_count, reopen, check=lambda path, count: expect(count == N, f"{count} songs"))
+    bench(f"playlist open {N}, migrating", open_count, legacy, check=migrated)
+    bench("playlist move x100", moves, full, check=moved)
+    bench("playlists open 20, first page", open_one, many, check=listed(ids(200)))
+    for box in boxes:
+        box.close()
+
+
+def cache_benchmarks():
+    box = Sandbox(latency=0, bandwidth=1024 ** 3, song_seconds=1)
+    cache = box.engine.cache
+    for song in songs(500):
+        box.engine.fetch_audio(song.ID)
+
+    def hits(_):
+        return [cache.get(f"id{i:07d}") for i in range(500)]
+
+    def fetch_hits(_):
+        return [box.engine.fetch_audio(f"id{i:07d}") for i in range(500)]
+
+    def all_hits(_, paths):
+        expect(all(path == cache.path(ID) for path, ID in zip(paths, ids(500))), "a hit returned the wrong file")
+        expect(box.engine.backend.downloads == 500, f"{box.engine.backend.downloads - 500} hits downloaded again")
+        expect(list(cache.entries)[-1] == "id0000499", "the last song used is not the newest entry")
+
+    def together(_):
+        # 8 threads want the same song, one download serves all of them
+        paths = []
+        threads = [threading.Thread(target=lambda: paths.append(box.engine.fetch_audio("together")))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return paths
+
+    def shared(_, paths):
+        expect(len(paths) == 8 and set(paths) == {cache.path("together")}, "threads got different files")
+        expect(box.engine.backend.downloads == 501, f"{box.engine.backend.downloads - 500} downloads for one song")
+        cache.remove("together")
+        box.engine.backend.downloads = 500
+
+    def small():
+        return AudioCache(tempfile.mkdtemp(prefix="cache-", dir=box.dir), cache.max_bytes, 50)
+
+    def over_limit(small_cache):
+        # the first song is played again after every download, so it is never the oldest
+        for ID in ids(100):
+            small_cache.fetch(ID, lambda i, target_dir: box.engine.backend.download(i, target_dir))
+            small_cache.get("id0000000")
+
+    def evicted(small_cache, _):
+        kept = set(small_cache.entries)
+        expect(kept == {"id0000000"} | set(ids(100)[51:]), "eviction did not drop the least recently used")
+        box.engine.backend.downloads = 500
+
+    bench("cache get x500", hits, check=all_hits)
+    bench("cache fetch hit x500", fetch_hits, check=all_hits)
+    bench("cache fetch one song from 8 threads", together, check=shared)
+    bench("cache index save 500 entries", lambda _: cache.save_index(),
+          check=lambda *_: expect(os.path.exists(cache.index_path), "no index written"))
+    bench("cache open 500 entries", lambda _: AudioCache(cache.cache_dir, cache.max_bytes, cache.max_entries),
+          check=lambda _, opened: expect(list(opened.entries) == list(cache.entries), "the index came back different"))
+    bench("cache fetch x100 over 50 entries", over_limit, small, rounds=3, check=evicted)
+    box.close()
+
+
+def measure(name, build):
+    # bytes allocated by build() that are still alive while its result is kept
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    print(f"{name:<40}{size / 1024 ** 2:9.2f} MiB   {size // N:6d} bytes per track")
+    return kept
+
+
+def memory_benchmarks():
+    box = Sandbox()
+    box.engine.playlist_store.append(songs(N))
+
+    def queue_from_library():
+        box.engine.queue.extend(box.engine.playlist_store.load())
+        return box.engine.queue
+
+    measure(f"library of {N} as dicts", lambda: [{"name": song.name, "ID": song.ID, "rowid": song.rowid}
+                                                 for song in box.engine.playlist_store.load()])
+    library = measure(f"library of {N} as Tracks", box.engine.playlist_store.load)
+    measure(f"queue of them, with its search index", lambda: box.engine.queue.extend(library) or box.engine.queue)
+    box.engine.queue.clear()
+    measure(f"library and queue, loaded again", queue_from_library)
+    try:
+        import resource  # not on windows
+    except ImportError:
+        resource = None
+    if resource is not None:
+        print(f"{'peak resident size':<40}{resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:9.2f} MiB")
+    box.close()
+
+
+def search_benchmarks():
+    words = ["love", "night", "東京", "夜", "ｼﾃｨ", "pop", "remix", "live", "午後", "song", "dream", "fire", "ocean",
+             "city", "tokyo", "rain", "summer", "heart", "blue", "star", "ＢＥＳＴ", "하늘", "moon", "girl"]
+    titles = [Track(" ".join(words[(i * 7 + j * 13 + i // 5) % len(words)] for j in range(4)) + f" {i}", str(i), i)
+              for i in range(30000)]
+
+    def full():
+        index = TitleIndex()
+        index.add_songs(titles)
+        return index
+
+    def ranked(_, results):
+        expect(results, "nothing found")
+        scores = [score for score, _, _ in results]
+        expect(scores == sorted(scores, reverse=True), "results are not best first")
+
+    bench("search index build 30000", lambda index: index.add_songs(titles), TitleIndex,
+          check=lambda index, _: expect(len(index) == 30000, f"{len(index)} titles indexed"))
+    # neighbouring words in a title are 13 apart in words, the two word queries are pairs that occur
+    for query in ("tokyo 夜", "東京", "best", "drem", "シティ heart"):
+        bench(f"search '{query}' in 30000", lambda index: index.search(query), full, rounds=3, check=ranked)
+
+
+def session_benchmarks():
+    boxes = []
+
+    def queued():
+        box = Sandbox()
+        boxes.append(box)
+        box.engine.queue.extend(songs(N))
+        box.engine.queue.history.extend(songs(100))
+        return box.engine.session
+
+    def saved():
+        session = queued()
+        session.save(61000, True, 40)
+        return session
+
+    def restore(session):
+        other = Session(session.path, TrackQueue())
+        other.restore(other.load())
+        return other
+
+    def restored(_, other):
+        expect([song.ID for song in other.queue] == ids(N), "the queue came back different")
+        expect([song.ID for song in other.queue.history] == ids(100), "the history came back different")
+        data = other.load()
+        expect((data["position"], data["playing"], data["volume"]) == (61000, True, 40), "the position came back different")
+
+    bench(f"session save {N}", lambda session: session.save(61000, True, 40), queued,
+          check=lambda session, _: restored(None, restore(session)))
+    bench(f"session save {N} again, unchanged", lambda session: session.save(61000, True, 40), saved,
+          check=lambda session, _: restored(None, restore(session)))
+    bench(f"session restore {N}", restore, saved, check=restored)
+    for box in boxes:
+        box.close()
+
+
+BENCHMARKS = {"playback": playback_benchmarks, "queue": queue_benchmarks, "playlist": playlist_benchmarks,
+              "cache": cache_benchmarks, "search": search_benchmarks, "session": session_benchmarks,
+              "memory": memory_benchmarks}
+
+if __name__ == '__main__':
+    selected = sys.argv[1:]
+    for name, run in BENCHMARKS.items():
+        if not selected or any(s in name for s in selected):
+            run()
+    print()
+    print(metrics.report())
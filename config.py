@@ -0,0 +1,70 @@
+import os
+import json
+
+CONFIG_FILE = "config.json"
+
+# defaults, any key can be overridden in config.json
+DEFAULTS = {
+    # audio cache
+    "cache_dir": "cache",
+    "cache_max_bytes": 2 * 1024 ** 3,
+    "cache_max_entries": 1000,
+    # seconds a resolved title/duration is trusted before asking YouTube again
+    "metadata_ttl": 7 * 24 * 3600,
+    # "native" keeps the downloaded audio as is, "mp3" converts every song to mp3
+    "audio_mode": "native",
+    "playable_formats": ["m4a", "mp3", "webm", "opus"],
+    # start playing from YouTube's stream while the song is still downloading
+    "streaming": True,
+    # milliseconds the end of a song overlaps the start of the next one, 0 for none
+    "crossfade_ms": 0,
+    # played songs remembered for the previous button
+    "history_size": 100,
+    # saved playlist, the old playlist.json is imported into a new library
+    "library_db": "library.db",
+    "legacy_playlist": "playlist.json",
+    # concurrent jobs per class: the song to play now, its stream url, prefetching and bulk downloads
+    "job_limits": {"play": 2, "stream": 2, "prefetch": 2, "background": 2},
+    # songs after the current one kept downloaded, grows on slow connections
+    "prefetch_min_depth": 1,
+    "prefetch_max_depth": 5,
+    # bytes per second all "download for offline" downloads may use together, 0 for no cap.
+    # how many run at once is job_limits["background"]
+    "offline_rate_limit": 0,
+    # playlist health check: runs after startup and re-checks songs not checked for max_age seconds,
+    # at most rate checks per second
+    "health_check_on_start": True,
+    "health_check_rate": 2,
+    "health_check_max_age": 7 * 24 * 3600,
+    # turn loud songs down to loudness_target LUFS, measured with ffmpeg in loudness_workers processes
+    "normalize_loudness": True,
+    "loudness_target": -14.0,
+    "loudness_workers": 2,
+    # name of the local socket a running player takes commands on (see control.py)
+    "control_socket": "music-player",
+    # folders of local audio files, indexed in local_index and rescanned after startup.
+    # a full folder or file path typed instead of a url adds local songs too
+    "local_folders": [],
+    "local_index": "local.db",
+    "local_scan_workers": 4,
+    # the queue, the current song's position and the volume are saved to session_file every
+    # session_interval seconds and on exit, and restored on the next start
+    "restore_session": True,
+    "session_file": "session.json",
+    "session_interval": 10,
+    # where songs come from: "youtube", or "fake" for silent songs served locally (offline work, benchmarks)
+    "backend": "youtube",
+    # FakeBackend settings, e.g. {"latency": 0.2, "bandwidth": 1048576}
+    "fake_backend": {},
+    # where timings are written every metrics_interval seconds and on exit, .json or .prom, "" for nowhere
+    "metrics_file": "",
+    "metrics_interval": 30,
+}
+
+
+def load_config(path=CONFIG_FILE):
+    config = dict(DEFAULTS)
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            config.update(json.load(f))
+    return config
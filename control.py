@@ -0,0 +1,123 @@
+import os
+import sys
+import json
+import socket
+import tempfile
+from config import load_config
+
+# commands a running player answers, one json object per line each way:
+#   {"command": "play", "url": optional}   plays url now, or resumes without one
+#   {"command": "enqueue", "url": ...}     adds url (a song or a playlist) to the queue
+#   {"command": "skip"}, {"command": "pause"}, {"command": "status"}
+# replies are {"ok": true, ...} or {"ok": false, "error": ...}.
+# kept free of Qt so handing a url to a running player does not pay for importing it
+
+
+def socket_path(config):
+    # in the user's own runtime dir when there is one, the shared temp dir lets anyone take the name first
+    name = config["control_socket"]
+    if os.name == 'posix' and not os.path.isabs(name):
+        runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+        if runtime_dir and os.path.isdir(runtime_dir):
+            return os.path.join(runtime_dir, name)
+        return os.path.join(tempfile.gettempdir(), f"{name}-{os.getuid()}")
+    return name
+
+
+def foreign_socket(path):
+    # True when another user owns what is at path, nothing is sent there and it is not listened on
+    if os.name != 'posix':
+        return False
+    try:
+        return os.lstat(path).st_uid != os.getuid()
+    except OSError:
+        return False
+
+
+def send(path, command, timeout=2.0):
+    # the running player's reply to command, None when no player is listening
+    if os.name != 'posix':
+        return send_local_socket(path, command, timeout)
+    if foreign_socket(path):
+        print(f"{path} belongs to another user, not sending commands to it")
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            s.settimeout(timeout)
+            s.connect(path)
+            s.sendall(json.dumps(command).encode() + b"\n")
+            reply = b""
+            while not reply.endswith(b"\n"):
+                chunk = s.recv(4096)
+                if not chunk:
+                    break
+                reply += chunk
+    except OSError:
+        return None
+    return json.loads(reply) if reply else None
+
+
+def send_local_socket(path, command, timeout):
+    # named pipes on windows, only Qt speaks QLocalServer's protocol there
+    from PyQt5.QtNetwork import QLocalSocket
+    s = QLocalSocket()
+    s.connectToServer(path)
+    if not s.waitForConnected(int(timeout * 1000)):
+        return None
+    s.write(json.dumps(command).encode() + b"\n")
+    s.flush()
+    while not s.canReadLine():
+        if not s.waitForReadyRead(int(timeout * 1000)):
+            return None
+    return json.loads(bytes(s.readLine()))
+
+
+def commands_from(args):
+    # main.py <url>... queues urls, --play plays the first one now, --skip, --pause and --status
+    # control the player without a url
+    urls = [arg for arg in args if not arg.startswith('--')]
+    commands = [{"command": "enqueue", "url": url} for url in urls]
+    if '--play' in args:
+        if commands:
+            commands[0]["command"] = "play"
+        else:
+            commands.append({"command": "play"})
+    for flag in ("skip", "pause", "status"):
+        if f"--{flag}" in args:
+            commands.append({"command": flag})
+    return commands
+
+
+def describe(command, reply):
+    # what to print for the reply to command, only errors and status are worth a line
+    if not reply.get("ok"):
+        return f"error: {reply.get('error')}"
+    if command["command"] == "status":
+        state = "playing" if reply["playing"] else "paused"
+        return f"{state}: {reply['now_playing'] or 'nothing'} ({reply['queue']} in queue)"
+    return None
+
+
+def forward_command_line(args):
+    # hands the commands in args to a running player and exits. returns them when there is none,
+    # for this process to run once it is up
+    commands = commands_from(args)
+    if not commands:
+        return []
+    path = socket_path(load_config())
+    replies = []
+    for command in commands:
+        reply = send(path, command)
+        if reply is None:
+            break
+        replies.append(reply)
+    if replies:
+        for command, reply in zip(commands, replies):
+            text = describe(command, reply)
+            if text is not None:
+                print(text)
+        sys.exit(0 if all(reply.get("ok") for reply in replies) else 1)
+    if not any("url" in command for command in commands) and '--daemon' not in args:
+        print("no player is running")
+        sys.exit(1)
+    return commands
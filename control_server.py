@@ -0,0 +1,41 @@
+import json
+from PyQt5.QtCore import QObject
+from PyQt5.QtNetwork import QLocalServer
+from control import send, foreign_socket
+
+
+class ControlServer(QObject):
+    # answers the commands described in control.py on a local socket.
+    # handler.control(command) runs on the GUI thread and returns the reply dict
+    def __init__(self, path, handler, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.handler = handler
+        self.server = QLocalServer(self)
+        self.server.setSocketOptions(QLocalServer.UserAccessOption)  # only this user may connect
+        self.server.newConnection.connect(self.new_connection)
+
+    def listen(self):
+        # False when another player already has the socket, or another user put something there
+        if foreign_socket(self.path):
+            print(f"{self.path} belongs to another user")
+            return False
+        if send(self.path, {"command": "status"}, timeout=0.5) is not None:
+            return False
+        QLocalServer.removeServer(self.path)  # left behind by a player that crashed
+        return self.server.listen(self.path)
+
+    def new_connection(self):
+        while self.server.hasPendingConnections():
+            client = self.server.nextPendingConnection()
+            client.readyRead.connect(lambda c=client: self.read(c))
+            client.disconnected.connect(client.deleteLater)
+
+    def read(self, client):
+        while client.canReadLine():
+            try:
+                reply = self.handler.control(json.loads(bytes(client.readLine())))
+            except Exception as e:
+                reply = {"ok": False, "error": str(e)}
+            client.write(json.dumps(reply).encode() + b"\n")
+            client.flush()
@@ -0,0 +1,39 @@
+import sys
+import signal
+from config import load_config
+from engine import Engine
+from playback import Playback
+from control import socket_path
+from control_server import ControlServer
+from PyQt5.QtCore import QCoreApplication, QTimer
+
+
+def run(commands=()):
+    # main.py --daemon: the player without a window, driven only through the control socket.
+    # commands are run once it listens
+    app = QCoreApplication(sys.argv)
+    config = load_config()
+    playback = Playback(config, Engine(config))
+    playback.now_playing.connect(lambda name: print(f"now playing: {name}"))
+    server = ControlServer(socket_path(config), playback)
+    if not server.listen():
+        print("another player is already running")
+        return 1
+    print(f"listening on {server.path}")
+    if config["restore_session"]:
+        playback.restore_session()
+    for command in commands:
+        playback.control(command)
+    # ctrl+c only reaches Python while it runs, the timer wakes it up now and then
+    signal.signal(signal.SIGINT, lambda *args: app.quit())
+    signal.signal(signal.SIGTERM, lambda *args: app.quit())
+    wake = QTimer()
+    wake.timeout.connect(lambda: None)
+    wake.start(500)
+    code = app.exec_()
+    playback.shutdown()
+    return code
+
+
+if __name__ == '__main__':
+    sys.exit(run())
@@ -0,0 +1,147 @@
+import os
+from audio_cache import AudioCache
+from track_queue import TrackQueue
+from playlist_store import PlaylistStore
+from backends import make_backend, SongUnavailable
+from metrics import metrics
+from search import TitleIndex, QueueIndex
+from loudness import Loudness
+from local_library import LocalLibrary, is_local
+from session import Session
+
+
+class Engine:
+    # everything the player does that is not Qt: the queue, the saved playlist, the audio cache and
+    # the backend songs come from. methods block, the window calls them from worker jobs.
+    # songs from local folders have IDs starting with "local:" and are played from where they are
+    def __init__(self, config, backend=None):
+        self.config = config
+        self.cache = AudioCache(config["cache_dir"], config["cache_max_bytes"], config["cache_max_entries"])
+        self.backend = backend if backend is not None else make_backend(config)
+        self.queue = TrackQueue(config["history_size"])
+        self.playlist_store = PlaylistStore(config["library_db"], config["legacy_playlist"])
+        self.session = Session(config["session_file"], self.queue)
+        # title search. the queue index follows the queue by itself, the one of the playlist shown is
+        # built on first use and told about adds and removes, those made while it is built are replayed
+        self.queue_index = QueueIndex(self.queue)
+        self.playlist_index = None
+        self.playlist_changes = []
+        self.loudness = Loudness(os.path.join(config["cache_dir"], "loudness.json"), config["loudness_target"],
+                                 config["loudness_workers"])
+        self.local = LocalLibrary(config["local_index"], config["local_folders"], config["local_scan_workers"])
+
+    def get_songs(self, url, progress):
+        # reports {"playlist", "songs"} batches as they are listed, returns how many songs there were
+        if self.local.handles(url):
+            songs = self.local.songs(url)
+            if songs:
+                progress({"playlist": len(songs) > 1, "songs": songs})
+            return len(songs)
+        count = 0
+        for is_playlist, songs in self.backend.iter_songs(url):
+            progress({"playlist": is_playlist, "songs": songs})
+            count += len(songs)
+        return count
+
+    def audio_path(self, ID):
+        # a file that plays ID right away, None when it has to be downloaded first
+        if is_local(ID):
+            return self.local.path(ID)
+        return self.cache.get(ID)
+
+    def fetch_audio(self, ID, rate_limit=None, progress=None):
+        if is_local(ID):
+            path = self.local.path(ID)
+            if path is None:
+                raise FileNotFoundError(f"the file of {ID} is gone")
+            return path
+        return self.cache.fetch(ID, lambda i, target_dir: self.download(i, target_dir, progress, rate_limit))
+
+    def download(self, ID, target_dir, progress=None, rate_limit=None):
+        # only cache misses get here
+        with metrics.span("fetch_audio"):
+            return self.backend.download(ID, target_dir, progress, rate_limit)
+
+    def stream_url(self, ID):
+        if is_local(ID):
+            return self.fetch_audio(ID)
+        return self.backend.stream_url(ID)
+
+    def check_song(self, ID):
+        # {"ID", "available", "name", "duration"}, other errors mean the check itself failed
+        if is_local(ID):
+            info = self.local.info(ID) if self.local.path(ID) is not None else None
+            if info is None:
+                return {"ID": ID, "available": False, "reason": "the file is gone"}
+            return {"ID": ID, "available": True, **info}
+        try:
+            info = self.backend.check(ID)
+        except SongUnavailable as e:
+            return {"ID": ID, "available": False, "reason": str(e)}
+        return {"ID": ID, "available": True, **info}
+
+    def gain(self, ID):
+        # volume factor that brings ID to the target loudness, 1 until it was measured
+        return self.loudness.gain(ID) if self.config["normalize_loudness"] else 1.0
+
+    def analyze_loudness(self, IDs):  # runs on a worker thread
+        # measures those of IDs that are cached or local and not measured yet, returns {ID: LUFS}
+        files = [(ID, self.local.path(ID) if is_local(ID) else self.cache.path(ID)) for ID in IDs]
+        return self.loudness.analyze([(ID, path) for ID, path in files if path is not None])
+
+    def build_playlist_index(self, songs):  # may run on a worker thread, songs come from the store
+        index = TitleIndex()
+        index.add_songs(songs)
+        return index
+
+    def set_playlist_index(self, index):
+        for added, change in self.playlist_changes:
+            if added:
+                index.add_songs(change)
+            else:
+                index.remove(change)
+        self.playlist_changes = []
+        self.playlist_index = index
+
+    def playlist_added(self, songs):
+        # songs as returned by PlaylistStore.append, with their rowid
+        if self.playlist_index is not None:
+            self.playlist_index.add_songs(songs)
+        else:
+            self.playlist_changes.append((True, songs))
+
+    def playlist_renamed(self, songs):
+        # rows the health check renamed, of any playlist. only those already indexed are the shown one's,
+        # an index built later reads the new titles from the store anyway
+        if self.playlist_index is not None:
+            self.playlist_index.add_songs([song for song in songs if song.rowid in self.playlist_index.titles])
+
+    def playlist_switched(self):
+        # the search index is of the playlist shown, a new one is built for the next search
+        self.playlist_index = None
+        self.playlist_changes = []
+
+    def playlist_removed(self, rowid):
+        if self.playlist_index is not None:
+            self.playlist_index.remove(rowid)
+        else:
+            self.playlist_changes.append((False, rowid))
+
+    def search(self, query, limit=50):
+        # [("queue" or "playlist", song)], queue matches first
+        results = [("queue", song) for _, _, song in self.queue_index.search(query, limit)]
+        if self.playlist_index is not None:
+            results += [("playlist", song) for _, _, song in self.playlist_index.search(query, limit)]
+        return results
+
+    def enqueue(self, url):
+        songs = []
+        self.get_songs(url, lambda batch: songs.extend(batch["songs"]))
+        self.queue.extend(songs)
+        return len(songs)
+
+    def skip(self):
+        # drops the song playing, returns the new queue[0] or None
+        if len(self.queue) > 0:
+            self.queue.pop_front()
+        return self.queue[0] if len(self.queue) > 0 else None
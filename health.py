@@ -0,0 +1,79 @@
+from collections import deque
+from PyQt5.QtCore import QTimer
+
+
+class HealthCheck:
+    # re-checks the playlist's songs as background jobs, only those not checked for max_age
+    # seconds. dead songs are marked unavailable in the store, changed titles are updated.
+    # a timer hands out at most rate checks per second, so no worker sits waiting for its turn
+    def __init__(self, store, check_job, max_age, rate=2, on_result=None, on_change=None):
+        self.store = store
+        self.check_job = check_job  # check_job(ID, on_finished, on_error), on_finished gets engine.check_song's result
+        self.max_age = max_age
+        self.waiting = deque()  # IDs not handed out yet
+        self.timer = QTimer()
+        self.timer.setInterval(int(1000 / rate) if rate > 0 else 0)
+        self.timer.timeout.connect(self.submit_next)
+        self.on_result = on_result  # on_result(result, renamed tracks) after the store was updated
+        self.on_change = on_change  # on_change() after every step, for the progress display
+        self.running = False
+        self.total = 0
+        self.checked = 0
+        self.unavailable = 0
+        self.errors = 0  # network trouble and such, checked again next time
+        self.pending = set()
+
+    def start(self):
+        if self.running:
+            return
+        IDs = self.store.stale_ids(self.max_age)
+        self.total, self.checked, self.unavailable, self.errors = len(IDs), 0, 0, 0
+        self.pending = set(IDs)
+        self.waiting = deque(IDs)
+        self.running = bool(IDs)
+        if IDs:
+            self.submit_next()
+            self.timer.start()
+        self.changed()
+
+    def submit_next(self):
+        if not self.waiting:
+            self.timer.stop()
+            return
+        ID = self.waiting.popleft()
+        self.check_job(ID, on_finished=self.result, on_error=lambda message, i=ID: self.failed(i, message))
+
+    def result(self, result):
+        ID = result["ID"]
+        if ID not in self.pending:
+            return
+        renamed = self.store.set_health(ID, result["available"], result.get("name"), result.get("duration"))
+        self.checked += 1
+        if not result["available"]:
+            self.unavailable += 1
+        if self.on_result is not None:
+            self.on_result(result, renamed)
+        self.step_done(ID)
+
+    def failed(self, ID, message):
+        if ID not in self.pending:
+            return
+        self.errors += 1
+        self.step_done(ID)
+
+    def step_done(self, ID):
+        self.pending.discard(ID)
+        self.running = bool(self.pending)
+        self.changed()
+
+    def changed(self):
+        if self.on_change is not None:
+            self.on_change()
+
+    def status(self):
+        text = f"checked {self.checked}/{self.total} songs"
+        if self.unavailable:
+            text += f", {self.unavailable} unavailable"
+        if self.errors:
+            text += f", {self.errors} could not be checked"
+        return text
@@ -0,0 +1,143 @@
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from track import Track
+
+# IDs of local songs are this plus the absolute path, everything else is a video ID
+LOCAL_PREFIX = "local:"
+AUDIO_EXTENSIONS = ('.mp3', '.m4a', '.aac', '.flac', '.ogg', '.opus', '.wav', '.webm', '.wma')
+
+
+def is_local(ID):
+    return ID.startswith(LOCAL_PREFIX)
+
+
+def read_tags(path):
+    # {"title", "artist", "album", "duration"}, whatever the file has. runs on the scan pool.
+    # tags need mutagen, without it the file name is the title
+    info = {"title": os.path.splitext(os.path.basename(path))[0], "artist": None, "album": None, "duration": None}
+    try:
+        import mutagen
+    except ImportError:
+        return info
+    try:
+        audio = mutagen.File(path, easy=True)
+    except Exception:
+        return info  # unreadable tags do not make the file unplayable
+    if audio is None:
+        return info
+    if getattr(audio, 'info', None) is not None:
+        info["duration"] = getattr(audio.info, 'length', None)
+    for key in ("title", "artist", "album"):
+        values = audio.get(key) if audio.tags is not None else None
+        if values:
+            info[key] = values[0]
+    return info
+
+
+class LocalLibrary:
+    # audio files in local folders, indexed in SQLite with their size and mtime so a rescan only
+    # reads the tags of files that changed. safe to use from any thread
+    def __init__(self, path, folders=(), workers=4):
+        self.folders = [os.path.abspath(os.path.expanduser(folder)) for folder in folders]
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        with self.db:
+            self.db.execute("CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, mtime REAL, "
+                            "title TEXT, artist TEXT, album TEXT, duration REAL)")
+
+    def handles(self, url):
+        # "local:" alone is the whole library, otherwise an absolute or ~ path of a file or folder.
+        # relative paths are left to the backend, "temp" is not meant to queue the player's own folder
+        if url.startswith(LOCAL_PREFIX):
+            return True
+        path = os.path.expanduser(url)
+        return os.path.isabs(path) and os.path.exists(path)
+
+    def scan(self, folders=None):
+        # brings the index in line with the folders, returns (files, changed, removed)
+        folders = self.folders if folders is None else folders
+        found = {}
+        for folder in folders:
+            for root, _, files in os.walk(folder):
+                for fn in files:
+                    if fn.lower().endswith(AUDIO_EXTENSIONS):
+                        path = os.path.join(root, fn)
+                        try:
+                            st = os.stat(path)
+                        except OSError:
+                            continue
+                        found[path] = (st.st_size, st.st_mtime)
+
+        with self.lock:
+            known = {}
+            for folder in folders:
+                rows = self.db.execute("SELECT path, size, mtime FROM files WHERE path >= ? AND path < ?",
+                                       self.prefix_range(folder))
+                known.update({path: (size, mtime) for path, size, mtime in rows})
+        changed = [path for path, stat in found.items() if known.get(path) != stat]
+        removed = [path for path in known if path not in found]
+
+        # reading tags opens every file, the pool overlaps the disk waits
+        with ThreadPoolExecutor(self.workers) as pool:
+            tags = list(pool.map(read_tags, changed))
+        with self.lock, self.db:
+            self.db.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                [(path, *found[path], info["title"], info["artist"], info["album"], info["duration"])
+                                 for path, info in zip(changed, tags)])
+            self.db.executemany("DELETE FROM files WHERE path = ?", [(path,) for path in removed])
+        return len(found), len(changed), len(removed)
+
+    def prefix_range(self, folder):
+        # every path below folder sorts between these two
+        folder = os.path.join(folder, '')
+        return folder, folder[:-1] + chr(ord(os.sep) + 1)
+
+    def songs(self, url):
+        # Tracks for a "local:" url, a folder or a file. folders outside the configured ones
+        # are scanned first
+        if url.startswith(LOCAL_PREFIX):
+            path = url[len(LOCAL_PREFIX):]
+        else:
+            path = os.path.abspath(os.path.expanduser(url))
+        if path and os.path.isfile(path):
+            self.scan_file(path)
+            condition, args = "path = ?", (path,)
+        elif path:
+            if not any(path == folder or path.startswith(os.path.join(folder, '')) for folder in self.folders):
+                self.scan([path])
+            condition, args = "path >= ? AND path < ?", self.prefix_range(path)
+        else:
+            condition, args = "1", ()
+        with self.lock:
+            rows = self.db.execute(f"SELECT path, title, artist FROM files WHERE {condition} ORDER BY path",
+                                   args).fetchall()
+        return [Track(f"{artist} - {title}" if artist else title, LOCAL_PREFIX + path) for path, title, artist in rows]
+
+    def scan_file(self, path):
+        st = os.stat(path)
+        with self.lock:
+            row = self.db.execute("SELECT size, mtime FROM files WHERE path = ?", (path,)).fetchone()
+        if row != (st.st_size, st.st_mtime):
+            info = read_tags(path)
+            with self.lock, self.db:
+                self.db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                (path, st.st_size, st.st_mtime, info["title"], info["artist"], info["album"],
+                                 info["duration"]))
+
+    def path(self, ID):
+        # the file of a local ID, None when it is gone
+        path = ID[len(LOCAL_PREFIX):]
+        return path if os.path.isfile(path) else None
+
+    def info(self, ID):
+        with self.lock:
+            row = self.db.execute("SELECT title, artist, duration FROM files WHERE path = ?",
+                                  (ID[len(LOCAL_PREFIX):],)).fetchone()
+        if row is None:
+            return None
+        title, artist, duration = row
+        return {"name": f"{artist} - {title}" if artist else title, "duration": duration}
@@ -0,0 +1,73 @@
+import os
+import re
+import json
+import threading
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+integrated = re.compile(r'I:\s+(-?[\d.]+) LUFS')
+
+
+def measure(path):
+    # integrated loudness of path in LUFS (EBU R128) using ffmpeg's ebur128 filter, None if ffmpeg
+    # could not read it. runs in a pool process, a missing ffmpeg raises so nothing is stored
+    result = subprocess.run(['ffmpeg', '-nostats', '-hide_banner', '-i', path, '-af', 'ebur128',
+                             '-f', 'null', '-'], capture_output=True, text=True, errors='replace')
+    found = integrated.findall(result.stderr)
+    if result.returncode != 0 or not found:
+        return None
+    return float(found[-1])  # the summary comes last
+
+
+class Loudness:
+    # measured loudness per video ID, kept in a json file next to the audio cache. measuring
+    # decodes the whole song so it runs in a separate process pool, never in the GUI process
+    def __init__(self, path, target=-14.0, workers=2):
+        self.path = path
+        self.target = target  # LUFS every song is turned down to
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.executor = None  # started on the first analysis
+        self.values = {}  # ID -> LUFS, None when it could not be measured
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.values = json.load(f)["loudness"]
+            except (ValueError, KeyError):
+                print("loudness file is broken, starting over...")
+
+    def analyzed(self, ID):
+        with self.lock:
+            return ID in self.values
+
+    def gain(self, ID):
+        # volume factor for ID, at most 1: QMediaPlayer can only turn loud songs down
+        with self.lock:
+            lufs = self.values.get(ID)
+        if lufs is None:
+            return 1.0
+        return min(1.0, 10 ** ((self.target - lufs) / 20))
+
+    def analyze(self, files):  # runs on a worker thread, files is [(ID, path)]
+        # measures the songs not measured yet, all of them in one go over the pool
+        files = [(ID, path) for ID, path in files if not self.analyzed(ID)]
+        if not files:
+            return {}
+        with self.lock:
+            if self.executor is None:
+                # spawn, forking a process that runs Qt threads is not safe
+                self.executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+            executor = self.executor
+        results = dict(zip((ID for ID, _ in files), executor.map(measure, [path for _, path in files])))
+        with self.lock:
+            self.values.update(results)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"loudness": self.values}, f)
+            os.replace(tmp_path, self.path)
+        return results
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
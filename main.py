@@ -1,48 +1,122 @@
+import time
+start_time = time.perf_counter()  # before any import, for --profile-startup
+
 import sys
-import os
+
+if __name__ == '__main__':
+    # in the frozen exe the loudness pool's processes start this file again, they stop here
+    import multiprocessing
+    multiprocessing.freeze_support()
+    # a running player takes the command line and this one exits before importing Qt,
+    # --daemon plays without a window
+    from control import forward_command_line
+    pending_commands = forward_command_line(sys.argv[1:])
+    if '--daemon' in sys.argv:
+        from daemon import run
+        sys.exit(run(pending_commands))
+
+import sqlite3
 import datetime
-import json
-from yt_dlp import YoutubeDL  # yt-dlp docs: https://github.com/yt-dlp/yt-dlp/blob/c54ddfba0f7d68034339426223d75373c5fc86df/yt_dlp/YoutubeDL.py#L457
+from config import load_config
+from engine import Engine
+from workers import BACKGROUND
+from playback import Playback
+from offline import OfflineSync
+from health import HealthCheck
+from control import socket_path
+from control_server import ControlServer
+from local_library import is_local
+from models import QueueModel, PlaylistModel, SearchModel
+from metrics import metrics
 from PyQt5.QtWidgets import *
 from PyQt5.QtCore import *
 from PyQt5.QtMultimedia import *
 
+startup_marks = [("start", start_time)]
+
+
+def mark_startup(label):
+    startup_marks.append((label, time.perf_counter()))
+    metrics.record(f"startup {label}", startup_marks[-1][1] - startup_marks[-2][1])
+
+
+def print_startup_profile():
+    mark_startup("window visible")
+    print("startup profile:")
+    for (_, before), (label, after) in zip(startup_marks, startup_marks[1:]):
+        print(f"  {label:<16}{(after - before) * 1000:8.1f} ms")
+    print(f"  {'total':<16}{(startup_marks[-1][1] - start_time) * 1000:8.1f} ms")
+
 
 class MusicPlayer(QMainWindow):
     def __init__(self):
         super().__init__()
-        if not os.path.exists("temp"):
-            os.makedirs("temp")
-            print("found no temp folder, creating...")
-        if not os.path.exists("playlist.json"):
-            open("playlist.json", "x")
-            print("found no playlist, creating...")
-            with open("playlist.json", "w") as temp:
-                json.dump({"songs": []}, temp, indent=2)
-        self.player = QMediaPlayer()
+        self.config = load_config()
+        # queue, playlist, cache and backend, the window only shows them and plays the audio
+        self.engine = Engine(self.config)
+        self.cache = self.engine.cache
+        self.playlist_store = self.engine.playlist_store
+        self.playlist = self.playlist_store.playlist()  # the one shown, playlists load only when shown
+        # jobs, the players and everything else about playing the queue, shared with the headless player
+        self.playback = Playback(self.config, self.engine, self)
+        self.playback.title.connect(self.show_title)
+        self.playback.state_changed.connect(self.show_state)
+        self.offline = OfflineSync(self.cache, self.playback.scheduler, self.playback.download_job,
+                                   self.config["job_limits"]["background"], self.config["offline_rate_limit"],
+                                   on_change=self.show_offline_status)
+        self.health = HealthCheck(self.playlist_store, self.check_job, self.config["health_check_max_age"],
+                                  self.config["health_check_rate"], on_result=self.song_checked,
+                                  on_change=self.show_health_status)
+        mark_startup("caches and stores")
         self.initUI()
+        mark_startup("initUI")
+        if self.config["restore_session"]:
+            self.playback.restore_session()
+            self.volume_slider.setSliderPosition(self.playback.volume)
+            mark_startup("session")
+        # yt-dlp is imported on a worker thread once the window has been painted, not before it
+        QTimer.singleShot(200, lambda: self.playback.run_job(
+            self.engine.backend.warm_up, job_class=BACKGROUND, on_error=lambda message: print(f"warm up failed: {message}")))
+        if self.config["health_check_on_start"]:
+            QTimer.singleShot(10000, self.health.start)
+        # the cached playlist is measured once after startup
+        if self.config["normalize_loudness"]:
+            QTimer.singleShot(15000, lambda: self.playback.analyze_loudness(self.playlist_store.ids()))
+        if self.config["local_folders"]:
+            QTimer.singleShot(5000, lambda: self.playback.run_job(self.engine.local.scan, job_class=BACKGROUND,
+                                                                  on_finished=self.local_scanned))
+        # a second main.py <url> and scripts talk to this window through the control socket
+        self.control_server = ControlServer(socket_path(self.config), self.playback, self)
+        if not self.control_server.listen():
+            print("another player is already running, this one does not take commands")
+        # timings go to a json file, or prometheus text when it ends in .prom
+        self.metrics_file = self.config["metrics_file"]
+        if self.metrics_file:
+            self.metrics_timer = QTimer(self)
+            self.metrics_timer.setInterval(self.config["metrics_interval"] * 1000)
+            self.metrics_timer.timeout.connect(lambda: metrics.export(self.metrics_file))
+            self.metrics_timer.start()
 
     def initUI(self):
         self.playlist_shown = False
-        self.playing = False
         self.filename = None
-        self.queue = []
+        self.queue = self.engine.queue
+        self.queue_model = QueueModel(self.queue, self)
         self.now_playing_num = 0
 
         # style sheets
         self.text_style = "color: white;"
-        self.playlist_list_style = "QPushButton{\
+        self.playlist_list_style = "QListView{\
                                     background-color : #252729;\
                                     color: white;\
                                     border: none;\
                                     margin: 0px;\
-                                    text-align: left;\
                                 }\
-                                QPushButton:pressed{\
+                                QListView::item:selected{\
                                     background-color: darkorange;\
                                     color: black;\
                                 }\
-                                QPushButton:hover:!pressed{\
+                                QListView::item:hover:!selected{\
                                     background-color: orange;\
                                     color: black;\
                                 }"
@@ -63,6 +137,9 @@ class MusicPlayer(QMainWindow):
                                             color: black;\
                                         }"
         self.highlight_text_style = "color: orange;"
+        self.queue_style = "QListView{\
+                                border: none;\
+                            }"
         self.window_style = "background-color: #252729;"
         self.normal_button_style = "QPushButton{\
                                     background-color : #64d6d2;\
@@ -137,15 +214,6 @@ class MusicPlayer(QMainWindow):
                                     }"
         self.timer = QTimer(self)
 
-        # buffer next song
-        self.buffer_option = True
-        self.next_song_downloaded = False
-        self.next_song_filename = ''
-
-        # load playlist
-        with open('playlist.json', 'r', encoding='utf-8') as f:
-            self.playlist = json.load(f)
-
         # Window
         self.setWindowTitle("YouTube Audio Player")
         self.setStyleSheet(self.window_style)
@@ -172,6 +240,33 @@ class MusicPlayer(QMainWindow):
         self.url_entry.setPlaceholderText("Enter YouTube URL")
         layout.addWidget(self.url_entry)
 
+        # search over the queue and the playlist, runs once typing pauses
+        self.search_entry = QLineEdit(self)
+        self.search_entry.setStyleSheet(self.url_style)
+        self.search_entry.setPlaceholderText("Search queue and playlist")
+        layout.addWidget(self.search_entry)
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(150)
+        self.search_timer.timeout.connect(self.search)
+        self.search_entry.textChanged.connect(lambda text: self.search_timer.start())
+        self.indexing_playlist = False
+        self.search_model = SearchModel(self)
+        self.search_view = QListView(self)
+        self.search_view.setModel(self.search_model)
+        self.search_view.setUniformItemSizes(True)
+        self.search_view.setFocusPolicy(Qt.NoFocus)
+        self.search_view.setStyleSheet(self.playlist_list_style)
+        self.search_view.activated.connect(self.play_search_result)
+        self.search_view.setVisible(False)
+        layout.addWidget(self.search_view)
+        self.search_queue_button = QPushButton('+')
+        self.search_queue_button.setToolTip("add to queue")
+        self.search_queue_button.setStyleSheet(self.playlist_up_down_style)
+        self.search_queue_button.clicked.connect(self.queue_search_result)
+        self.search_queue_button.setVisible(False)
+        layout.addWidget(self.search_queue_button)
+
         # Download and play button
         self.download_play_button = QPushButton(self)
         self.download_play_button.setFocusPolicy(Qt.NoFocus)
@@ -188,16 +283,25 @@ class MusicPlayer(QMainWindow):
         self.play_icon = self.style().standardIcon(getattr(QStyle, 'SP_MediaPlay'))
         self.play_button.setIcon(self.play_icon)
         self.play_button.setStyleSheet(self.play_style)
-        self.play_button.clicked.connect(self.play_pause)
+        self.play_button.clicked.connect(self.playback.play_pause)
         horizontal_button.addWidget(self.play_button)
 
+        # previous song button
+        self.previous_song_button = QPushButton(self)
+        self.previous_song_button.setFocusPolicy(Qt.NoFocus)
+        self.previous_icon = self.style().standardIcon(getattr(QStyle, 'SP_MediaSkipBackward'))
+        self.previous_song_button.setIcon(self.previous_icon)
+        self.previous_song_button.setStyleSheet(self.normal_button_style)
+        self.previous_song_button.clicked.connect(self.playback.previous_song)
+        horizontal_button.addWidget(self.previous_song_button)
+
         # next song button
         self.next_song_button = QPushButton(self)
         self.next_song_button.setFocusPolicy(Qt.NoFocus)
         self.next_icon = self.style().standardIcon(getattr(QStyle, 'SP_MediaSkipForward'))
         self.next_song_button.setIcon(self.next_icon)
         self.next_song_button.setStyleSheet(self.normal_button_style)
-        self.next_song_button.clicked.connect(self.next_song)
+        self.next_song_button.clicked.connect(self.playback.next_song)
         horizontal_button.addWidget(self.next_song_button)
 
         # add playlist button
@@ -238,6 +342,12 @@ class MusicPlayer(QMainWindow):
         self.queue_label = QLabel("Song queue:")
         self.queue_label.setStyleSheet(self.text_style)
         self.queue_box.addWidget(self.queue_label)
+        self.queue_view = QListView(self)
+        self.queue_view.setModel(self.queue_model)
+        self.queue_view.setUniformItemSizes(True)  # lets the view lay out huge queues without measuring rows
+        self.queue_view.setFocusPolicy(Qt.NoFocus)
+        self.queue_view.setStyleSheet(self.queue_style)
+        self.queue_box.addWidget(self.queue_view)
         layout.addLayout(self.queue_box)
 
         # initialise playlists
@@ -245,7 +355,7 @@ class MusicPlayer(QMainWindow):
         self.playlist_label.setStyleSheet(self.text_style)
         self.playlist_label.setVisible(False)
         self.playlist_box.addWidget(self.playlist_label)
-        self.init_playlist()
+        self.playlist_model = None  # built by init_playlist the first time the playlist is shown
         layout.addLayout(self.playlist_box)
 
         self.timer.setInterval(100)
@@ -267,8 +377,7 @@ class MusicPlayer(QMainWindow):
         layout.addLayout(horizontal_slider)
 
         # volume
-        self.volume = 30
-        self.player.setVolume(self.volume)
+        self.playback.change_volume(self.playback.volume)
         self.volume_slider = QSlider(Qt.Horizontal, self)
         self.volume_slider.setFocusPolicy(Qt.NoFocus)
         self.volume_slider.setRange(0, 100)
@@ -280,6 +389,28 @@ class MusicPlayer(QMainWindow):
         horizontal_slider.addWidget(self.volume_text)
         horizontal_slider.addWidget(self.volume_slider)
 
+    def closeEvent(self, event):
+        self.playback.shutdown()
+        self.control_server.server.close()
+        if self.metrics_file:
+            metrics.export(self.metrics_file)
+        if '--metrics' in sys.argv:
+            print(metrics.report())
+        QMainWindow.closeEvent(self, event)
+
+    def show_title(self, text):
+        self.setWindowTitle(text or "YouTube Audio Player")
+
+    def show_state(self):
+        if self.playback.playing:
+            self.play_button.setIcon(self.pause_icon)
+            self.play_button.setStyleSheet(self.pause_style)
+        else:
+            self.play_button.setIcon(self.play_icon)
+            self.play_button.setStyleSheet(self.play_style)
+        if self.playback.loaded_id is not None:
+            self.timer.start()
+
     def mousePressEvent(self, event):
         focused_widget = QApplication.focusWidget()
         if isinstance(focused_widget, QLineEdit):
@@ -287,70 +418,178 @@ class MusicPlayer(QMainWindow):
         QMainWindow.mousePressEvent(self, event)
 
     def init_playlist(self):
-        if len(self.playlist["songs"]) > 0:
-            for i in range(len(self.playlist["songs"])):
-                temp_box = QHBoxLayout()
-                temp = QPushButton()
-
-                # playlist titles
-                temp.setFocusPolicy(Qt.NoFocus)
-                f = self.play_from_playlist(self.playlist['songs'][i]['ID'])
-                temp.clicked.connect(f)
-                temp.setText(f"{i + 1}: {self.playlist['songs'][i]['name']}")
-                temp.setVisible(False)
-                temp.setStyleSheet(self.playlist_list_style)
-
-                # playlist actions
-                up = QPushButton('↑')
-                down = QPushButton('↓')
-                u = self.rank_up(i)
-                d = self.rank_down(i)
-                up.setStyleSheet(self.playlist_up_down_style)
-                down.setStyleSheet(self.playlist_up_down_style)
-                up.clicked.connect(u)
-                down.clicked.connect(d)
-                up.setVisible(False)
-                down.setVisible(False)
-
-                temp_box.addWidget(up)
-                temp_box.addWidget(down)
-                temp_box.addWidget(temp, Qt.AlignLeft)  # add playlist to layout
-                self.playlist_box.addLayout(temp_box)
-
-    def rank_down(self, i):
-        def ret_func():
-            maxi = len(self.playlist['songs']) - 1
-            if not i == maxi:
-                temp = self.playlist['songs'][i]
-                self.playlist['songs'][i] = self.playlist['songs'][i + 1]
-                self.playlist['songs'][i + 1] = temp
-                self.refresh_playlist()
-                with open('playlist.json', 'w') as f2:
-                    json.dump(self.playlist, f2, indent=2)
-        return ret_func
-
-    def rank_up(self, i):
-        def ret_func():
-            if not i == 0:
-                print(i)
-                temp = self.playlist['songs'][i]
-                self.playlist['songs'][i] = self.playlist['songs'][i - 1]
-                self.playlist['songs'][i - 1] = temp
-                self.refresh_playlist()
-                with open('playlist.json', 'w') as f2:
-                    json.dump(self.playlist, f2, indent=2)
-        return ret_func
+        # the manifest lists the playlists, their songs are read a page at a time once one is picked
+        playlist_choice_box = QHBoxLayout()
+        self.playlist_choice = QComboBox(self)
+        self.playlist_choice.setFocusPolicy(Qt.NoFocus)
+        for playlist, name, _ in self.playlist_store.playlists():
+            self.playlist_choice.addItem(name, playlist)
+        self.playlist_choice.setCurrentIndex(self.playlist_choice.findData(self.playlist.id))
+        self.playlist_choice.activated.connect(self.choose_playlist)
+        self.new_playlist_button = QPushButton('+')
+        self.new_playlist_button.setToolTip("new playlist")
+        self.new_playlist_button.setStyleSheet(self.playlist_up_down_style)
+        self.new_playlist_button.clicked.connect(self.new_playlist)
+        playlist_choice_box.addWidget(self.playlist_choice)
+        playlist_choice_box.addWidget(self.new_playlist_button)
+        self.playlist_box.addLayout(playlist_choice_box)
+
+        self.playlist_model = PlaylistModel(self.playlist, parent=self)
+        self.playlist_view = QListView(self)
+        self.playlist_view.setModel(self.playlist_model)
+        self.playlist_view.setUniformItemSizes(True)
+        self.playlist_view.setDragDropMode(QAbstractItemView.InternalMove)
+        self.playlist_view.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.playlist_view.setFocusPolicy(Qt.NoFocus)
+        self.playlist_view.setStyleSheet(self.playlist_list_style)
+        self.playlist_view.activated.connect(self.play_from_playlist)
+        self.playlist_box.addWidget(self.playlist_view)
+
+        # playlist actions
+        playlist_actions = QHBoxLayout()
+        self.rank_up_button = QPushButton('↑')
+        self.rank_down_button = QPushButton('↓')
+        self.rank_up_button.setStyleSheet(self.playlist_up_down_style)
+        self.rank_down_button.setStyleSheet(self.playlist_up_down_style)
+        self.rank_up_button.clicked.connect(self.rank_up)
+        self.rank_down_button.clicked.connect(self.rank_down)
+        self.remove_button = QPushButton('✕')
+        self.remove_button.setStyleSheet(self.playlist_up_down_style)
+        self.remove_button.clicked.connect(self.remove_from_playlist)
+        self.offline_button = QPushButton('⇩')
+        self.offline_button.setToolTip("download all for offline")
+        self.offline_button.setStyleSheet(self.playlist_up_down_style)
+        self.offline_button.clicked.connect(self.download_for_offline)
+        playlist_actions.addWidget(self.rank_up_button)
+        playlist_actions.addWidget(self.rank_down_button)
+        playlist_actions.addWidget(self.remove_button)
+        playlist_actions.addWidget(self.offline_button)
+        playlist_actions.addStretch()
+        self.playlist_box.addLayout(playlist_actions)
+
+    def choose_playlist(self, i):
+        playlist = self.playlist_choice.itemData(i)
+        if playlist is None or playlist == self.playlist.id:
+            return
+        self.playlist = self.playlist_store.playlist(playlist)
+        old_model = self.playlist_model
+        self.playlist_model = PlaylistModel(self.playlist, parent=self)
+        self.playlist_view.setModel(self.playlist_model)
+        old_model.deleteLater()
+        self.engine.playlist_switched()
+        self.indexing_playlist = False
+        self.update_playlist_label()
+
+    def new_playlist(self):
+        name, ok = QInputDialog.getText(self, "new playlist", "name:")
+        if not ok or not name.strip():
+            return
+        try:
+            playlist = self.playlist_store.create_playlist(name.strip())
+        except sqlite3.IntegrityError:
+            print(f"there already is a playlist called {name.strip()}")
+            return
+        self.playlist_choice.addItem(name.strip(), playlist)
+        self.playlist_choice.setCurrentIndex(self.playlist_choice.count() - 1)
+        self.choose_playlist(self.playlist_choice.count() - 1)
+
+    def rank_down(self):
+        row = self.playlist_view.currentIndex().row()
+        if row >= 0:
+            self.playlist_model.move(row, row + 1)
+
+    def rank_up(self):
+        row = self.playlist_view.currentIndex().row()
+        if row >= 0:
+            self.playlist_model.move(row, row - 1)
+
+    def remove_from_playlist(self):
+        row = self.playlist_view.currentIndex().row()
+        if row >= 0:
+            self.engine.playlist_removed(self.playlist_model.remove(row).rowid)
+
+    def download_for_offline(self):
+        # a second click stops the sync, what was downloaded so far stays and is resumed next time
+        if self.offline.running:
+            self.offline.cancel()
+            return
+        unavailable = self.playlist_store.unavailable_ids()
+        songs = [song for song in self.playlist_model.all_songs() if song.ID not in unavailable and not is_local(song.ID)]
+        if len(songs) > self.cache.max_entries:
+            print(f"the cache only keeps {self.cache.max_entries} songs, raise cache_max_entries to keep all {len(songs)}")
+        self.offline.start(songs)
+
+    def show_offline_status(self):
+        self.offline_button.setText('■' if self.offline.running else '⇩')
+        if not self.offline.running and self.offline.done:
+            self.playback.analyze_loudness(self.offline.IDs)
+        self.update_playlist_label()
+
+    def update_playlist_label(self):
+        parts = []
+        if self.offline.total:
+            parts.append(self.offline.status())
+        if self.health.running:
+            parts.append(self.health.status())
+        self.playlist_label.setText("playlist: " + "; ".join(parts))
+
+    def check_job(self, ID, on_finished=None, on_error=None):
+        self.playback.run_job(self.engine.check_song, ID, job_class=BACKGROUND, key=("check", ID),
+                     on_finished=on_finished, on_error=on_error)
+
+    def song_checked(self, result, renamed):
+        if renamed:
+            self.engine.playlist_renamed(renamed)  # the search index takes the new titles
+        if self.playlist_model is not None:
+            self.playlist_model.song_checked(result["ID"], result["available"], renamed)
+
+    def show_health_status(self):
+        self.update_playlist_label()
+        if not self.health.running and self.health.unavailable:
+            print(f"health check: {self.health.status()}")
+
+    def local_scanned(self, counts):
+        files, changed, removed = counts
+        print(f"local library: {files} songs, {changed} new or changed, {removed} removed")
+
+    def search(self):
+        if self.engine.playlist_index is None and not self.indexing_playlist:
+            # built off the GUI thread, the queue is searched meanwhile
+            self.indexing_playlist = True
+            self.playback.run_job(self.engine.build_playlist_index, self.playlist.load(), job_class=BACKGROUND,
+                         on_finished=lambda index, playlist=self.playlist.id: self.playlist_indexed(playlist, index))
+        query = self.search_entry.text()
+        self.search_model.set_results(self.engine.search(query) if query.strip() else [])
+        self.search_view.setVisible(bool(query.strip()))
+        self.search_queue_button.setVisible(bool(query.strip()))
+
+    def playlist_indexed(self, playlist, index):
+        if playlist != self.playlist.id:
+            return  # another playlist was picked while it was built
+        self.engine.set_playlist_index(index)
+        self.indexing_playlist = False
+        self.search()
+
+    def play_search_result(self, index):
+        _, song = self.search_model.results[index.row()]
+        self.playback.play_now(song)
+
+    def queue_search_result(self):
+        row = self.search_view.currentIndex().row()
+        if row >= 0:
+            _, song = self.search_model.results[row]
+            self.queue.append(song)
+            self.playback.buffer_next()
 
     def volume_adjust(self):
-        self.volume = self.volume_slider.sliderPosition()
-        self.player.setVolume(self.volume)
+        self.playback.change_volume(self.volume_slider.sliderPosition())
 
     def add_yt_playlist(self):
+        from yt_dlp import YoutubeDL
         youtube_url = self.url_entry.text()
         youtube_dl_opts = {}
         with YoutubeDL(youtube_dl_opts) as ydl:
             info_dict = ydl.extract_info(youtube_url, download=False)
-            print(info_dict)
             length = len(info_dict['entries'])
             playlist = []
             for i in range(length):
@@ -358,296 +597,95 @@ class MusicPlayer(QMainWindow):
                 playlist.append(temp)
             return playlist
 
-    def play_from_playlist(self, ID):
-        def ret_func():
-            print(ID)
-            self.play_music(self.download_audio(ID))
-            self.queue.insert(0, {"name": f"{self.song_name}", "ID": f"{self.filename}"})
-            self.refresh_queue()
-
-        return ret_func
-
-    def get_song_file_name(self, youtube_url):
-        youtube_dl_opts = {}
-        with YoutubeDL(youtube_dl_opts) as ydl:
-            info_dict = ydl.extract_info(youtube_url, download=False)
-            ext = info_dict.get("ext", None)
-            filename = info_dict.get("id", None)
-            song_name = info_dict.get('title', None)
-            is_playlist = info_dict.get('_type', None) == 'playlist'
-            print(filename)
-            return song_name, filename, ext, is_playlist, info_dict
-
-    def download_audio(self, youtube_url):  # TODO: separate permanent download and on-the-spot play
-        # remove suffixes
-        if youtube_url.find('&') >= 0:
-            youtube_url = youtube_url[:youtube_url.index('&')]
-        print(youtube_url)
-
-        # read temp folder
-        self.setWindowTitle("Loading music...")
-        for fn in os.listdir("./temp"):
-            os.remove(os.path.join("./temp", fn))
-            print("temp file exists, deleting...")
-        res = self.get_song_file_name(youtube_url)
-
-        self.song_name = res[0]
-        self.filename = res[1]
-        self.ext = res[2]
-        self.is_playlist = res[3]
-        if self.is_playlist:
-            self.add_url_to_queue()
-            self.play_pause()
-        else:
-            print(f"file name: {self.filename}")
-            print(f"song name: {self.song_name}")
-
-            self.download_only(self.filename)
-            # return os.path.join("./temp/", self.filename + ".mp3")
-
-    def download_only(self, ID):
-        ydl_opts = {'outtmpl': f'/temp/{ID}.%(ext)s', 'format': 'bestaudio', 'postprocessors': [{
-            'key': 'FFmpegVideoConvertor',
-            'preferedformat': 'mp3'
-        }]}
-        with YoutubeDL(ydl_opts) as ydl:
-            ydl.download(ID)
-        # return os.path.join(f"./temp/{ID}.mp3")
+    def play_from_playlist(self, index):
+        song = self.playlist_model.songs[index.row()]
+        self.queue.insert(0, song)
+        self.playback.load_and_play(song.ID)
 
     def keyPressEvent(self, event):  # keypress detection
         if (event.type() == QEvent.KeyPress) and (event.key() == Qt.Key_Space):
-            self.play_pause()
+            self.playback.play_pause()
         elif event.key() == Qt.Key_Up:
-            if self.volume > 100:
-                self.volume = 100
-                self.player.setVolume(self.volume)
-            else:
-                self.volume += 5
-                self.player.setVolume(self.volume)
-                self.volume_slider.setSliderPosition(self.volume)
+            self.playback.change_volume(self.playback.volume + 5)
+            self.volume_slider.setSliderPosition(self.playback.volume)
         elif event.key() == Qt.Key_Down:
-            if self.volume < 0:
-                self.volume = 0
-                self.player.setVolume(self.volume)
-            else:
-                self.volume -= 5
-                self.player.setVolume(self.volume)
-                self.volume_slider.setSliderPosition(self.volume)
+            self.playback.change_volume(self.playback.volume - 5)
+            self.volume_slider.setSliderPosition(self.playback.volume)
 
     def download_and_play(self):
-        self.setWindowTitle("Loading...")
-        if self.playing:
-            self.play_stop()
-        url = self.url_entry.text()
-        if not url:
-            self.setWindowTitle("YouTube Audio Player")
-            return
-
-        res = self.get_song_file_name(url)
-        is_playlist = res[3]
-        info_dict = res[4]
-
-        if is_playlist:
-            length = len(info_dict['entries'])
-            playlist = []
-            for i in range(length):
-                temp = {'name': info_dict['entries'][i].get('fulltitle', None), 'ID': info_dict['entries'][i].get("display_id", None)}
-                playlist.append(temp)
-            self.queue = self.queue + playlist
-            self.refresh_queue()
-            self.play_pause()
-        else:
-            audio_file = os.path.join(f"./temp/{info_dict['id']}.mp3")  # TODO: extract id & playlist using youtube link
-                                                                        # TODO: make new class using QObject to run in different thread
-            self.download_audio(url)
-            self.playing = True
-            self.play_button.setIcon(self.pause_icon)
-            self.play_music(audio_file)
-            self.buffer_next()
-            self.queue.insert(0, {"name": f"{self.song_name}", "ID": f"{self.filename}"})
-            self.refresh_queue()
-
-    def refresh_queue(self):
-        r = self.queue_box.count()
-        if r > 0:
-            for i in reversed(range(r)):
-                temp = self.queue_box.itemAt(i).widget()
-                if temp != self.queue_label:
-                    self.queue_box.removeWidget(temp)
-        for i in range(len(self.queue)):
-            self.queue_box.addWidget(QLabel(f"{i + 1}: {self.queue[i]['name']}"))
-            if i == 0:
-                self.queue_box.itemAt(i + 1).widget().setStyleSheet(self.highlight_text_style)
-            else:
-                self.queue_box.itemAt(i + 1).widget().setStyleSheet(self.text_style)
-
-    def play_music(self, file_path):
-        self.player.setMedia(QMediaContent(QUrl.fromLocalFile(file_path)))
-        self.player.play()
-        self.volume_slider.setSliderPosition(self.volume)
-        self.playing = True
-        self.setWindowTitle(f"Now playing: {self.queue[0]['name']}")
-        self.buffer_next()
-        self.timer.start()
-
-    def play_stop(self):
-        if self.playing:
-            self.player.stop()
-            self.playing = False
-            self.play_button.setText("play")
-
-    def play_pause(self):
-        if self.playing:
-            self.player.pause()
-            self.play_button.setIcon(self.play_icon)
-            self.playing = False
-            self.play_button.setStyleSheet(self.play_style)
-        elif len(self.queue) > 0:
-            if self.player.state() == 0:
-                audio_file = f'./temp/{self.queue[0]["ID"]}.mp3'
-                self.download_audio(self.queue[0]["ID"])
-                self.playing = True
-                self.play_button.setIcon(self.pause_icon)
-                self.play_music(audio_file)
-                print(f"queue dict: {self.queue}")
-                self.refresh_queue()
-            else:
-                self.player.play()
-                self.play_button.setIcon(self.pause_icon)
-                self.playing = True
-                self.play_button.setStyleSheet(self.pause_style)
+        if self.url_entry.text():
+            self.playback.play_url(self.url_entry.text())
 
     def add_playlist_to_queue(self):
-        print(self.playlist['songs'])
-        self.queue = self.queue + self.playlist['songs']
-        self.refresh_queue()
+        # songs the health check found dead are left out
+        unavailable = self.playlist_store.unavailable_ids()
+        if self.playlist_model is None:
+            songs = self.playlist.load()
+        else:
+            songs = self.playlist_model.all_songs()
+        self.queue.extend([song for song in songs if song.ID not in unavailable])
+        self.playback.buffer_next()
 
     def add_url_to_queue(self):
         if self.url_entry.text():
-            res = self.get_song_file_name(self.url_entry.text())
-            is_playlist = res[3]
-            if is_playlist:
-                info_dict = res[4]
-                length = len(info_dict['entries'])
-                playlist = []
-                for i in range(length):
-                    temp = {'name': info_dict['entries'][i].get('fulltitle', None), 'ID': info_dict['entries'][i].get("display_id", None)}
-                    playlist.append(temp)
-                self.queue = self.queue + playlist
-                self.refresh_queue()
-            else:
-                self.queue.append(
-                    {"name": res[0], "ID": res[1]})
-                self.refresh_queue()
+            self.playback.enqueue(self.url_entry.text())
 
     def update_slider(self):
-        duration = self.player.duration()
+        with metrics.span("ui_refresh"):
+            self.refresh_slider()
+
+    def refresh_slider(self):
+        duration = self.playback.player.duration()
         dt = datetime.timedelta(milliseconds=duration / 2)
         disp_duration = "{:0=2}".format(dt.seconds // 60) + ":" + "{:0=2}".format(dt.seconds % 60)
         if duration > 0:
-            position = self.player.position()
+            position = self.playback.player.position()
             self.slider.setValue(int((position / duration) * 1000))
             st = datetime.timedelta(milliseconds=position / 2)
             disp_runtime = "{:0=2}".format(st.seconds // 60) + ":" + "{:0=2}".format(st.seconds % 60)
             self.time_text.setText(disp_runtime + " / " + disp_duration)
-            if position == duration:  # goto next song after all is played
-                self.next_song()
-
-    def next_song(self):
-        if self.player.state() != 0:
-            self.player.stop()
-        if len(self.queue) > 0:
-            if self.next_song_downloaded:
-                audio_file = self.next_song_filename
-            else:
-                audio_file = f'./temp/{self.queue[1]["ID"]}.mp3'
-                self.download_audio(self.queue[1]["ID"])
-            del self.queue[0]
-            self.play_music(audio_file)
-            self.playing = True
-            self.play_button.setIcon(self.pause_icon)
-            print(f"queue dict: {self.queue}")
-            self.buffer_next()
-        self.refresh_queue()
-
-    def buffer_next(self):
-        if self.buffer_option:
-            if len(self.queue) > 1:
-                self.next_song_filename = os.path.join(f"./temp/{self.queue[1]['ID']}.mp3")
-                self.download_only(self.queue[1]['ID'])
-                self.next_song_downloaded = True
 
     def set_position(self, position):
-        duration = self.player.duration()
+        duration = self.playback.player.duration()
         if duration > 0:
             value = position / 1000 * duration
-            self.player.setPosition(int(value))
+            self.playback.player.setPosition(int(value))
 
     def add_to_playlist(self):
-        global added_in_playlist
-        self.setWindowTitle("checking...")
-        res = self.get_song_file_name(self.url_entry.text())
-        is_playlist = res[3]
-        info_dict = res[4]
-        if is_playlist:
-            length = len(info_dict['entries'])
-            yt_playlist = []
-            for i in range(length):
-                temp = {'name': info_dict['entries'][i].get('fulltitle', None), 'ID': info_dict['entries'][i].get("display_id", None)}
-                yt_playlist.append(temp)
-            self.playlist["songs"] = self.playlist["songs"] + yt_playlist
-            with open('playlist.json', 'w') as f2:
-                json.dump(self.playlist, f2, indent=2)
-            print(self.playlist)
-            self.refresh_playlist()
-            if self.playing:
-                self.setWindowTitle(f"Now playing: self.queue[0]")
+        if not self.url_entry.text():
+            print("nothing for me to add bruh")
+            return
+        self.playback.set_title("checking...")
+        self.playback.run_job(self.engine.get_songs, self.url_entry.text(),
+                              on_progress=self.songs_for_playlist(self.playlist), on_finished=self.playback.songs_done)
+
+    def songs_for_playlist(self, playlist):
+        # every batch goes to the playlist shown when the button was clicked, even if another is shown by now
+        def ret_func(batch):
+            if playlist.id != self.playlist.id:
+                playlist.append(batch["songs"])
             else:
-                self.setWindowTitle('YouTube Audio Player')
-        else:
-            if self.url_entry is not None:
-                self.setWindowTitle(f"adding {self.song_name} ...")
-                self.playlist["songs"].append({"name": self.song_name, "ID": self.filename})
-                temp = QLabel(f"{self.playlist_box.count() + 1}: {self.song_name}")
-                self.playlist_box.addWidget(temp)
-                temp.setStyleSheet(self.text_style)
-                with open('playlist.json', 'w') as f2:
-                    json.dump(self.playlist, f2, indent=2)
-                if self.playing:
-                    self.setWindowTitle(f"Now playing: {self.song_name}")
+                if self.playlist_model is None:
+                    added = self.playlist.append(batch["songs"])
                 else:
-                    self.setWindowTitle('YouTube Audio Player')
-            else:
-                print("nothing for me to add bruh")
+                    added = self.playlist_model.extend(batch["songs"])
+                self.engine.playlist_added(added)
+            self.playback.set_title(f"adding {batch['songs'][-1].name} ...")
 
-    def refresh_playlist(self):
-
-        r = self.playlist_box.count()
-        if r > 1:
-            for i in reversed(range(1, r)):
-                temp = self.playlist_box.itemAt(i).layout()
-                self.playlist_box.removeItem(temp)
-        print("here")
-        for i in range(len(self.playlist)):
-            self.init_playlist()
-            if self.playlist_shown:
-                self.show_playlist()
-                self.show_playlist()
-            else:
-                self.show_playlist()
+        return ret_func
 
     def show_playlist(self):
-        index = self.playlist_box.count()
-        while index > 1:
-            my_layout = self.playlist_box.itemAt(index - 1).layout()
-            wid_count = my_layout.count()
-            while wid_count > 0:
-                my_widget = my_layout.itemAt(wid_count - 1).widget()
-                my_widget.setVisible(not self.playlist_shown)
-                wid_count -= 1
-            index -= 1
-        self.playlist_box.itemAt(0).widget().setVisible(not self.playlist_shown)
+        if self.playlist_model is None:
+            self.init_playlist()
         self.playlist_shown = not self.playlist_shown
+        self.playlist_label.setVisible(self.playlist_shown)
+        self.playlist_choice.setVisible(self.playlist_shown)
+        self.new_playlist_button.setVisible(self.playlist_shown)
+        self.playlist_view.setVisible(self.playlist_shown)
+        self.rank_up_button.setVisible(self.playlist_shown)
+        self.rank_down_button.setVisible(self.playlist_shown)
+        self.remove_button.setVisible(self.playlist_shown)
+        self.offline_button.setVisible(self.playlist_shown)
 
         if self.playlist_shown:
             self.show_playlist_button.setText('Hide playlist')
@@ -656,9 +694,15 @@ class MusicPlayer(QMainWindow):
             self.show_playlist_button.setText('Show playlist')
             self.show_playlist_button.setStyleSheet(self.normal_button_style)
 
-
 if __name__ == '__main__':
+    mark_startup("imports")
     app = QApplication(sys.argv)
+    mark_startup("QApplication")
     ex = MusicPlayer()
     ex.show()
+    mark_startup("show")
+    for command in pending_commands:  # urls given on the command line when no player was running
+        ex.playback.control(command)
+    if '--profile-startup' in sys.argv:
+        QTimer.singleShot(0, print_startup_profile)  # runs once the first show has been processed
     sys.exit(app.exec_())
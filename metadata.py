@@ -0,0 +1,181 @@
+import os
+import json
+import time
+import copy
+import threading
+from urllib.parse import urlparse, parse_qs
+from metrics import metrics
+from track import Track
+
+# parts of an info_dict the player never uses
+DROPPED_KEYS = ('thumbnails', 'subtitles', 'automatic_captions', 'heatmap', 'storyboards', 'chapters',
+                'description', 'tags', 'categories')
+# what is kept on disk, stream urls expire within hours so they only live in memory
+DURABLE_KEYS = ('id', 'title', 'fulltitle', 'ext', 'duration', 'uploader', 'webpage_url')
+
+
+def warm_up():
+    # importing yt-dlp and building its extractor list takes a while, do it before the first click
+    from yt_dlp import YoutubeDL
+    YoutubeDL({'quiet': True})
+
+
+class MetadataCache:
+    # resolves urls and IDs with one long lived YoutubeDL per worker thread and remembers the result,
+    # full info with stream urls in memory until they expire, titles and durations on disk for ttl seconds
+    def __init__(self, path, ttl, audio_format):
+        self.path = path
+        self.ttl = ttl
+        self.audio_format = audio_format
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.durable = {}  # ID -> {"info", "fetched"}
+        self.resolved = {}  # ID -> {"info", "expires"} with formats and stream urls
+        self.aliases = {}  # url -> ID
+        self.in_flight = {}  # url or ID -> threading.Event of the extraction currently running
+        self.dirty = False  # durable or aliases changed since the file was written
+        self.save_lock = threading.Lock()  # one writer of the file at a time
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                self.durable = data["entries"]
+                self.aliases = data["aliases"]
+            except (ValueError, KeyError):
+                print("metadata cache is broken, starting over...")
+
+    def extractor(self):
+        ydl = getattr(self.local, 'ydl', None)
+        if ydl is None:
+            from yt_dlp import YoutubeDL
+            ydl = YoutubeDL({'format': self.audio_format, 'quiet': True})
+            self.local.ydl = ydl
+        return ydl
+
+    def resolve(self, url, need_streams=False):
+        # returns the info_dict of url, playlists come back as extracted and are not cached.
+        # concurrent calls for the same song share one extraction, like AudioCache.fetch
+        while True:
+            now = time.time()
+            with self.lock:
+                ID = self.aliases.get(url, url)
+                resolved = self.resolved.get(ID)
+                if resolved is not None and resolved["expires"] > now:
+                    return resolved["info"]
+                durable = self.durable.get(ID)
+                if not need_streams and durable is not None and durable["fetched"] + self.ttl > now:
+                    return durable["info"]
+                event = self.in_flight.get(ID)
+                if event is None:
+                    event = threading.Event()
+                    self.in_flight[ID] = event
+                    break
+            # if the shared extraction fails the next loop runs our own
+            event.wait()
+
+        try:
+            with metrics.span("extract_info"):
+                info_dict = self.extractor().extract_info(url, download=False)
+            if info_dict.get('_type', None) == 'playlist':
+                return info_dict
+            info_dict = self.slim(self.extractor().sanitize_info(info_dict))
+            self.store(url, info_dict)
+            return info_dict
+        finally:
+            with self.lock:
+                del self.in_flight[ID]
+            event.set()
+
+    def iter_songs(self, url, batch_size=50):
+        # yields (is_playlist, [Track, ...]) batches. playlists are listed flat, page by page,
+        # so the first songs arrive before the rest of the playlist is known. a single video is
+        # resolved fully on the way and cached like resolve() would
+        ID = self.aliases.get(url)
+        if ID is not None and ID in self.durable:
+            info_dict = self.resolve(url)
+            yield False, [Track(info_dict['title'], info_dict['id'])]
+            return
+
+        ydl = self.extractor()
+        with metrics.span("extract_info"):
+            info_dict = ydl.extract_info(url, download=False, process=False)
+            while info_dict.get('_type') in ('url', 'url_transparent'):
+                info_dict = ydl.extract_info(info_dict['url'], download=False, process=False)
+            if info_dict.get('_type') != 'playlist':
+                info_dict = ydl.process_ie_result(info_dict, download=False)
+
+        if info_dict.get('_type') != 'playlist':
+            info_dict = self.slim(ydl.sanitize_info(info_dict))
+            self.store(url, info_dict)
+            yield False, [Track(info_dict['title'], info_dict['id'])]
+            return
+
+        entries = info_dict['entries']
+        info_dict = None  # only the entries are needed, each one is dropped once its Track is made
+        if hasattr(entries, 'getslice'):  # paged lists
+            entries = entries.getslice()
+        batch = []
+        for entry in entries:
+            if not entry or not entry.get('id'):
+                continue  # deleted or private entries of flat lists can come without one
+            batch.append(Track(entry.get('title'), entry['id']))
+            if len(batch) >= batch_size:
+                yield True, batch
+                batch = []
+        if batch:
+            yield True, batch
+
+    def check(self, ID):
+        # asks YouTube again, without choosing formats, and refreshes the stored title and duration.
+        # raises what yt-dlp raises for videos that are gone
+        with metrics.span("extract_info"):
+            info_dict = self.extractor().extract_info(ID, download=False, process=False)
+        durable = {key: info_dict.get(key) for key in DURABLE_KEYS}
+        with self.lock:
+            self.durable[info_dict['id']] = {"info": durable, "fetched": time.time()}
+            self.dirty = True
+        return durable
+
+    def info_for_download(self, ID):
+        # a fresh copy yt-dlp can process without extracting again
+        return copy.deepcopy(self.resolve(ID, need_streams=True))
+
+    def slim(self, info_dict):
+        for key in DROPPED_KEYS:
+            info_dict.pop(key, None)
+        audio_only = [f for f in info_dict.get('formats') or [] if f.get('vcodec') == 'none']
+        if audio_only:
+            info_dict['formats'] = audio_only
+        return info_dict
+
+    def store(self, url, info_dict):
+        ID = info_dict['id']
+        now = time.time()
+        with self.lock:
+            for old_ID in [i for i, resolved in self.resolved.items() if resolved["expires"] <= now]:
+                del self.resolved[old_ID]
+            self.resolved[ID] = {"info": info_dict, "expires": self.stream_expiry(info_dict, now)}
+            self.durable[ID] = {"info": {key: info_dict.get(key) for key in DURABLE_KEYS}, "fetched": now}
+            self.aliases[url] = ID
+            self.dirty = True
+
+    def flush(self):
+        # writes the file if anything changed, called now and then instead of after every result.
+        # entries are replaced, never changed in place, so copies of the dicts are a safe snapshot
+        with self.save_lock:
+            with self.lock:
+                if not self.dirty:
+                    return
+                data = {"entries": dict(self.durable), "aliases": dict(self.aliases)}
+                self.dirty = False
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+
+    def stream_expiry(self, info_dict, now):
+        # googlevideo urls carry their expiry time, keep a margin for long downloads
+        expire = parse_qs(urlparse(info_dict.get('url') or '').query).get('expire')
+        if expire:
+            return int(expire[0]) - 600
+        return now + 3600
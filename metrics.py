@@ -0,0 +1,115 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+# samples kept per span name, percentiles are over the most recent ones
+WINDOW = 500
+PERCENTILES = (50, 90, 99)
+
+
+class Metrics:
+    # timings of the hot paths. spans can be recorded from any thread, the totals cover
+    # the whole run and the percentiles the last WINDOW samples
+    def __init__(self, window=WINDOW):
+        self.window = window
+        self.lock = threading.Lock()
+        self.samples = {}  # name -> deque of seconds
+        self.totals = {}  # name -> [count, seconds]
+        self.counters = {}  # name -> count
+        self.open_spans = {}  # (name, key) -> start, for spans that end in another callback
+
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def start(self, name, key=None):
+        # for spans that start and end in different callbacks, a new start replaces an unfinished one
+        with self.lock:
+            self.open_spans[(name, key)] = time.perf_counter()
+
+    def finish(self, name, key=None):
+        # returns the seconds since start(name, key), or None when it was not started
+        with self.lock:
+            start = self.open_spans.pop((name, key), None)
+        if start is None:
+            return None
+        seconds = time.perf_counter() - start
+        self.record(name, seconds)
+        return seconds
+
+    def cancel(self, name, key=None):
+        with self.lock:
+            self.open_spans.pop((name, key), None)
+
+    def record(self, name, seconds):
+        with self.lock:
+            samples = self.samples.get(name)
+            if samples is None:
+                samples = self.samples[name] = deque(maxlen=self.window)
+                self.totals[name] = [0, 0.0]
+            samples.append(seconds)
+            self.totals[name][0] += 1
+            self.totals[name][1] += seconds
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def summary(self):
+        # {"spans": {name: {"count", "total", "p50", ...}}, "counters": {...}}, seconds throughout
+        with self.lock:
+            samples = {name: sorted(values) for name, values in self.samples.items()}
+            totals = {name: list(total) for name, total in self.totals.items()}
+            counters = dict(self.counters)
+        spans = {}
+        for name, values in samples.items():
+            spans[name] = {"count": totals[name][0], "total": totals[name][1]}
+            for p in PERCENTILES:
+                spans[name][f"p{p}"] = values[min(len(values) - 1, len(values) * p // 100)]
+        return {"spans": spans, "counters": counters}
+
+    def prometheus(self):
+        summary = self.summary()
+        lines = ["# TYPE player_span_seconds summary"]
+        for name, span in sorted(summary["spans"].items()):
+            for p in PERCENTILES:
+                lines.append(f'player_span_seconds{{span="{name}",quantile="{p / 100}"}} {span[f"p{p}"]:.6f}')
+            lines.append(f'player_span_seconds_sum{{span="{name}"}} {span["total"]:.6f}')
+            lines.append(f'player_span_seconds_count{{span="{name}"}} {span["count"]}')
+        lines.append("# TYPE player_events_total counter")
+        for name, count in sorted(summary["counters"].items()):
+            lines.append(f'player_events_total{{event="{name}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def export(self, path):
+        # prometheus text for .prom files, json otherwise
+        if path.endswith(".prom"):
+            text = self.prometheus()
+        else:
+            text = json.dumps(self.summary(), indent=1)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+    def report(self):
+        # a table for the terminal, milliseconds
+        summary = self.summary()
+        lines = [f"{'span':<24}{'count':>7}{'p50':>10}{'p90':>10}{'p99':>10}"]
+        for name, span in sorted(summary["spans"].items()):
+            lines.append(f"{name:<24}{span['count']:>7}" + "".join(f"{span[f'p{p}'] * 1000:10.1f}"
+                                                                 for p in PERCENTILES))
+        for name, count in sorted(summary["counters"].items()):
+            lines.append(f"{name:<24}{count:>7}")
+        return "\n".join(lines)
+
+
+# the one the whole player records into
+metrics = Metrics()
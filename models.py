@@ -0,0 +1,199 @@
+from PyQt5.QtCore import Qt, QAbstractListModel, QModelIndex
+from PyQt5.QtGui import QColor
+
+
+class QueueModel(QAbstractListModel):
+    # shows a TrackQueue, queue[0] is the song playing. the queue reports every change as the rows
+    # it touched so the view only repaints what is visible
+    def __init__(self, queue, parent=None):
+        super().__init__(parent)
+        self.queue = queue
+        self.queue.add_listener(self)
+        self.renumber_rows = None  # rows whose number changes with the current edit
+        self.text_color = QColor("white")
+        self.highlight_color = QColor("orange")
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.queue)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = index.row()
+        if role == Qt.DisplayRole:
+            return f"{row + 1}: {self.queue[row].name}"
+        if role == Qt.ForegroundRole:
+            return self.highlight_color if row == 0 else self.text_color
+        return None
+
+    # TrackQueue listener
+    def about_to_insert(self, first, last):
+        self.beginInsertRows(QModelIndex(), first, last)
+        self.renumber_rows = (last + 1, None)
+
+    def inserted(self):
+        self.endInsertRows()
+        self.renumber(*self.renumber_rows)
+
+    def about_to_remove(self, first, last):
+        self.beginRemoveRows(QModelIndex(), first, last)
+        self.renumber_rows = (first, None)
+
+    def removed(self):
+        self.endRemoveRows()
+        self.renumber(*self.renumber_rows)
+
+    def about_to_move(self, row, to):
+        self.beginMoveRows(QModelIndex(), row, row, QModelIndex(), to if to < row else to + 1)
+        self.renumber_rows = (min(row, to), max(row, to))
+
+    def moved(self):
+        self.endMoveRows()
+        self.renumber(*self.renumber_rows)
+
+    def about_to_reset(self):
+        self.beginResetModel()
+
+    def reset(self):
+        self.endResetModel()
+
+    def renumber(self, first, last=None):
+        # row numbers are part of the text, the view only redraws the rows it shows
+        last = len(self.queue) - 1 if last is None else last
+        if first <= last:
+            self.dataChanged.emit(self.index(first), self.index(last), [Qt.DisplayRole, Qt.ForegroundRole])
+
+
+class PlaylistModel(QAbstractListModel):
+    # the saved playlist, loaded from the store a page at a time as the view scrolls.
+    # rows can be dragged or moved up and down one at a time
+    def __init__(self, store, page_size=200, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self.page_size = page_size
+        self.songs = []  # the first rows of the playlist, in order
+        self.total = store.count()
+        self.unavailable = store.unavailable_ids()  # found dead by the health check
+        self.text_color = QColor("white")
+        self.unavailable_color = QColor("gray")
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.songs)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and len(self.songs) < self.total
+
+    def fetchMore(self, parent=QModelIndex()):
+        songs = self.store.load(len(self.songs), self.page_size)
+        if songs:
+            self.beginInsertRows(QModelIndex(), len(self.songs), len(self.songs) + len(songs) - 1)
+            self.songs.extend(songs)
+            self.endInsertRows()
+
+    def all_songs(self):
+        if not self.canFetchMore():
+            return list(self.songs)
+        return self.store.load()
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = index.row()
+        song = self.songs[row]
+        if role == Qt.DisplayRole:
+            if song.ID in self.unavailable:
+                return f"{row + 1}: {song.name} (unavailable)"
+            return f"{row + 1}: {song.name}"
+        if role == Qt.ForegroundRole:
+            return self.unavailable_color if song.ID in self.unavailable else self.text_color
+        return None
+
+    def song_checked(self, ID, available, renamed):
+        # renamed are the store's rows of ID when the health check found a new title
+        names = {song.rowid: song.name for song in renamed}
+        if available:
+            self.unavailable.discard(ID)
+        else:
+            self.unavailable.add(ID)
+        for row, song in enumerate(self.songs):
+            if song.ID == ID:
+                song.name = names.get(song.rowid, song.name)
+                self.dataChanged.emit(self.index(row), self.index(row), [Qt.DisplayRole, Qt.ForegroundRole])
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.ItemIsDropEnabled  # dropping between rows
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsDragEnabled
+
+    def supportedDropActions(self):
+        return Qt.MoveAction
+
+    def moveRows(self, source_parent, source_row, count, destination_parent, destination_child):
+        # QListView's internal drag and drop lands here one row at a time
+        if count != 1 or source_parent.isValid() or destination_parent.isValid():
+            return False
+        if not self.beginMoveRows(source_parent, source_row, source_row, destination_parent, destination_child):
+            return False
+        to = destination_child if destination_child < source_row else destination_child - 1
+        song = self.songs.pop(source_row)
+        self.songs.insert(to, song)
+        self.store.move(song.rowid, self.songs[to - 1].rowid if to > 0 else None)
+        self.endMoveRows()
+        # only the rows between the two positions changed their number
+        self.dataChanged.emit(self.index(min(source_row, to)), self.index(max(source_row, to)), [Qt.DisplayRole])
+        return True
+
+    def move(self, row, to):
+        if row == to or not 0 <= to < len(self.songs):
+            return False
+        return self.moveRow(QModelIndex(), row, QModelIndex(), to if to < row else to + 1)
+
+    def extend(self, songs):
+        # returns the songs with their rowid
+        if not songs:
+            return []
+        fully_loaded = not self.canFetchMore()
+        songs = self.store.append(songs)
+        self.total += len(songs)
+        if fully_loaded:
+            first = len(self.songs)
+            self.beginInsertRows(QModelIndex(), first, first + len(songs) - 1)
+            self.songs.extend(songs)
+            self.endInsertRows()
+        return songs
+
+    def remove(self, row):
+        self.beginRemoveRows(QModelIndex(), row, row)
+        song = self.songs.pop(row)
+        self.store.remove(song.rowid)
+        self.total -= 1
+        self.endRemoveRows()
+        if row < len(self.songs):
+            self.dataChanged.emit(self.index(row), self.index(len(self.songs) - 1), [Qt.DisplayRole])
+        return song
+
+
+class SearchModel(QAbstractListModel):
+    # search results, each one is ("queue" or "playlist", song)
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.results = []
+        self.text_color = QColor("white")
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.results)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        source, song = self.results[index.row()]
+        if role == Qt.DisplayRole:
+            return f"{source}: {song.name}"
+        if role == Qt.ForegroundRole:
+            return self.text_color
+        return None
+
+    def set_results(self, results):
+        self.beginResetModel()
+        self.results = results
+        self.endResetModel()
@@ -0,0 +1,107 @@
+import time
+from workers import BACKGROUND
+
+
+class OfflineSync:
+    # downloads a whole playlist into the audio cache as background jobs, as many at once as the
+    # background job limit allows. songs already cached are skipped and an interrupted sync
+    # resumes its .part files when started again
+    def __init__(self, cache, scheduler, download_job, parallel=2, rate_limit=0, on_change=None):
+        self.cache = cache
+        self.scheduler = scheduler
+        self.download_job = download_job  # download_job(ID, job_class, on_finished, on_progress, on_error, rate_limit, key)
+        self.parallel = parallel
+        self.rate_limit = rate_limit  # bytes per second for the whole sync, 0 for no cap
+        self.on_change = on_change  # on_change() after every step, for the progress display
+        self.running = False
+        self.reset([], 0)
+
+    def reset(self, IDs, skipped):
+        self.IDs = IDs  # the playlist's songs
+        self.total = len(IDs)
+        self.skipped = skipped  # already cached when the sync started
+        self.done = 0
+        self.failed = []
+        self.pending = set()
+        self.sizes = {}  # ID -> total bytes, as far as known
+        self.received = {}  # ID -> bytes downloaded in this sync, resumed bytes not counted
+        self.resumed_from = {}  # ID -> bytes the .part had when it was picked up
+        self.started = time.monotonic()
+
+    def start(self, songs):
+        IDs = list(dict.fromkeys(song.ID for song in songs))
+        missing = [ID for ID in IDs if not self.cache.contains(ID)]
+        self.reset(IDs, len(IDs) - len(missing))
+        self.running = bool(missing)
+        # the cap is shared by the downloads that run at the same time
+        per_job = self.rate_limit // self.parallel if self.rate_limit else None
+        for ID in missing:
+            self.pending.add(ID)
+            self.download_job(ID, BACKGROUND, on_finished=lambda path, i=ID: self.finished(i),
+                              on_progress=self.record_progress,
+                              on_error=lambda message, i=ID: self.finished(i, message), rate_limit=per_job,
+                              key=("offline", ID))
+        self.changed()
+
+    def cancel(self):
+        # only our downloads, the health check and loudness jobs share the class
+        self.scheduler.cancel(BACKGROUND, only={("offline", ID) for ID in self.pending})
+        self.pending = set()
+        self.running = False
+        self.changed()
+
+    def finished(self, ID, error=None):
+        if ID not in self.pending:
+            return
+        self.pending.discard(ID)
+        if error is None:
+            self.done += 1
+        else:
+            self.failed.append((ID, error))
+        if ID in self.sizes:
+            self.received[ID] = self.sizes[ID] - self.resumed_from.get(ID, 0)
+        self.running = bool(self.pending)
+        self.changed()
+
+    def record_progress(self, d):
+        ID = (d.get('info_dict') or {}).get('id')
+        if ID not in self.pending:
+            return
+        total = d.get('total_bytes') or d.get('total_bytes_estimate')
+        if total:
+            self.sizes[ID] = total
+        downloaded = d.get('downloaded_bytes') or 0
+        self.resumed_from.setdefault(ID, downloaded if d.get('status') == 'downloading' else 0)
+        self.received[ID] = downloaded - self.resumed_from[ID]
+        self.changed()
+
+    def changed(self):
+        if self.on_change is not None:
+            self.on_change()
+
+    def rate(self):
+        # bytes per second over the whole sync
+        elapsed = time.monotonic() - self.started
+        return sum(self.received.values()) / elapsed if elapsed > 0 else 0
+
+    def eta(self):
+        # seconds left, None until there is something to go by
+        rate = self.rate()
+        if not self.sizes or rate <= 0:
+            return None
+        average = sum(self.sizes.values()) / len(self.sizes)
+        left = 0
+        for ID in self.pending:
+            left += self.sizes.get(ID, average) - self.resumed_from.get(ID, 0) - self.received.get(ID, 0)
+        return max(0, left) / rate
+
+    def status(self):
+        text = f"offline: {self.skipped + self.done}/{self.total} songs"
+        if self.failed:
+            text += f", {len(self.failed)} failed"
+        if self.running:
+            text += f", {self.rate() / 1024 ** 2:.1f} MB/s"
+            eta = self.eta()
+            if eta is not None:
+                text += f", {int(eta) // 60}:{int(eta) % 60:02} left"
+        return text
@@ -0,0 +1,448 @@
+from workers import Job, Scheduler, PLAY_NOW, STREAM, BACKGROUND
+from prefetch import Prefetcher
+from local_library import is_local
+from metrics import metrics
+from PyQt5.QtCore import QObject, QThreadPool, QTimer, QElapsedTimer, QUrl, pyqtSignal
+from PyQt5.QtMultimedia import QMediaPlayer, QMediaContent
+
+
+class Playback(QObject):
+    # plays the engine's queue: jobs, prefetching, the two players, crossfade, loudness and the
+    # session. shared by the window and the headless player, which only show what it reports
+    title = pyqtSignal(str)  # what the window title should say, "" for the default
+    now_playing = pyqtSignal(str)  # the name of the song that started
+    state_changed = pyqtSignal()  # playing or loaded_id changed
+
+    def __init__(self, config, engine, parent=None):
+        super().__init__(parent)
+        self.config = config
+        self.engine = engine
+        self.queue = engine.queue
+        self.cache = engine.cache
+        self.pool = QThreadPool(self)
+        self.scheduler = Scheduler(self.pool, config["job_limits"], self)
+        self.prefetcher = Prefetcher(self.cache, self.scheduler, self.download_job,
+                                     config["prefetch_min_depth"], config["prefetch_max_depth"],
+                                     on_ready=self.prefetched)
+        # two players, the second one has the next song loaded so switching to it is gapless
+        self.player = QMediaPlayer(self)
+        self.next_player = QMediaPlayer(self)
+        for player in (self.player, self.next_player):
+            player.setNotifyInterval(100)
+            player.mediaStatusChanged.connect(lambda status, p=player: self.media_status_changed(p, status))
+            player.positionChanged.connect(lambda position, p=player: self.position_changed(p, position))
+        self.preloaded_id = None
+        self.preloaded_path = None
+        self.player_gain = {}  # player -> loudness factor of the song it has loaded
+        self.playing = False
+        self.loaded_id = None
+        self.volume = 30
+        self.title_text = ""
+        # buffer next song
+        self.buffer_option = True
+
+        # crossfade between songs, 0 turns it off
+        self.crossfade_ms = config["crossfade_ms"]
+        self.fading_player = None
+        self.fade_clock = QElapsedTimer()
+        self.fade_timer = QTimer(self)
+        self.fade_timer.setInterval(50)
+        self.fade_timer.timeout.connect(self.fade_step)
+
+        # songs entering the cache are measured a few at a time, one small job after the other so a
+        # whole library waiting to be measured never holds a background slot for long
+        self.loudness_pending = set()
+        self.loudness_running = False
+        self.loudness_chunk = 2 * config["loudness_workers"]
+        self.loudness_timer = QTimer(self)
+        self.loudness_timer.setSingleShot(True)
+        self.loudness_timer.setInterval(2000)
+        self.loudness_timer.timeout.connect(self.analyze_pending)
+
+        # the last session's queue comes back with its song loaded at the saved position
+        self.resume_position = 0
+        self.resume_playing = False
+        self.session_timer = QTimer(self)
+        self.session_timer.setInterval(config["session_interval"] * 1000)
+        self.session_timer.timeout.connect(self.save_session)
+        self.session_timer.start()
+
+    def run_job(self, func, *args, job_class=PLAY_NOW, key=None, report_progress=False,
+                on_finished=None, on_error=None, on_progress=None):
+        job = Job(func, *args, report_progress=report_progress or on_progress is not None, key=key)
+        if on_finished is not None:
+            job.signals.finished.connect(on_finished)
+        job.signals.error.connect(on_error if on_error is not None else self.job_failed)
+        if on_progress is not None:
+            job.signals.progress.connect(on_progress)
+        self.scheduler.submit(job, job_class)
+
+    def download_job(self, ID, job_class, on_finished=None, on_progress=None, on_error=None, rate_limit=None, key=None):
+        # downloads always take a progress callback so they can be cancelled mid-transfer.
+        # the key is the ID unless the caller cancels its own downloads by theirs
+        self.run_job(self.engine.fetch_audio, ID, rate_limit, job_class=job_class, key=ID if key is None else key,
+                     report_progress=True,
+                     on_finished=on_finished, on_progress=on_progress, on_error=on_error)
+
+    def set_title(self, text):
+        self.title_text = text
+        self.title.emit(text)
+
+    def job_failed(self, message):
+        print(f"job failed: {message}")
+        self.set_title("")
+
+    def control(self, command):
+        # a command from the control socket, see control.py
+        name = command.get("command")
+        if name == "play":
+            if command.get("url"):
+                self.play_url(command["url"])
+            elif not self.playing:
+                self.play_pause()
+        elif name == "enqueue":
+            if not command.get("url"):
+                return {"ok": False, "error": "enqueue needs a url"}
+            self.enqueue(command["url"])
+        elif name == "skip":
+            self.next_song()
+        elif name == "pause":
+            if self.playing:
+                self.play_pause()
+        elif name != "status":
+            return {"ok": False, "error": f"unknown command {name!r}"}
+        return {"ok": True, "playing": self.playing,
+                "now_playing": self.queue[0].name if len(self.queue) > 0 else None, "queue": len(self.queue),
+                "position": self.player.position(), "duration": self.player.duration()}
+
+    def play_url(self, url):
+        self.set_title("Loading...")
+        if self.playing:
+            self.play_stop()
+        self.run_job(self.engine.get_songs, url, on_progress=self.songs_for_play(), on_finished=self.songs_done)
+
+    def enqueue(self, url):
+        self.run_job(self.engine.get_songs, url, on_progress=self.songs_for_queue, on_finished=self.songs_done)
+
+    def songs_for_play(self):
+        started = [False]
+
+        def ret_func(batch):
+            if batch["playlist"]:
+                self.queue.extend(batch["songs"])
+                self.set_title(f"Loading... {len(self.queue)} songs in queue")
+                if not started[0]:  # the first song plays while the rest is still listed
+                    started[0] = True
+                    self.play_pause()
+                else:
+                    self.buffer_next()
+            else:
+                self.queue.insert(0, batch["songs"][0])
+                self.load_and_play(batch["songs"][0].ID)
+
+        return ret_func
+
+    def songs_for_queue(self, batch):
+        self.queue.extend(batch["songs"])
+        self.buffer_next()
+
+    def songs_done(self, count):
+        metrics.count("songs_added", count)
+        if self.playing and len(self.queue) > 0:
+            self.set_title(f"Now playing: {self.queue[0].name}")
+        elif self.title_text.startswith(("Loading...", "checking...", "adding")):
+            self.set_title("")
+
+    def play_now(self, song):
+        # puts song first in the queue, or moves it there, and plays it
+        # the head is checked first, clicking the playing song again needs no scan
+        i = 0 if len(self.queue) > 0 and self.queue[0].ID == song.ID else self.queue.index_of(song.ID)
+        if i == 0 and self.loaded_id == song.ID:
+            return  # already playing
+        if i > 0:
+            self.queue.move(i, 0)
+        elif i < 0:
+            self.queue.insert(0, song)
+        self.load_and_play(song.ID)
+
+    def load_and_play(self, ID):
+        # plays queue[0] as soon as its audio is in the cache, without blocking the window
+        # whatever was loading for an older queue head is not needed anymore
+        self.scheduler.cancel(PLAY_NOW, keep=(ID,))
+        self.scheduler.cancel(STREAM, keep=(ID,))
+        self.loaded_id = None
+        self.resume_position = 0
+        metrics.start("time_to_first_audio")
+        # the standby player may have it loaded already, re-planning first would load the song after it there
+        cached = self.preloaded_path if ID == self.preloaded_id else self.engine.audio_path(ID)
+        if cached is not None:
+            metrics.count("cache_hit")
+            self.play_downloaded(ID, cached)  # plans what comes next once it plays
+            return
+        metrics.count("cache_miss")
+        self.buffer_next()
+        self.set_title("Loading music...")
+        if self.config["streaming"] and self.engine.backend.streams():
+            # start from the stream right away, the cache download runs alongside for the next replay
+            # and is played instead if the stream could not be resolved. the url is resolved in its own
+            # job class so an extraction for a song skipped meanwhile cannot hold up the next download
+            self.run_job(self.engine.stream_url, ID, job_class=STREAM, key=ID,
+                         on_finished=lambda url: self.play_downloaded(ID, url),
+                         on_error=lambda message: print(f"streaming {ID} failed: {message}"))
+            self.download_job(ID, PLAY_NOW, on_finished=lambda path: self.play_downloaded(ID, path),
+                              on_progress=self.prefetcher.record_progress)
+        else:
+            self.download_job(ID, PLAY_NOW, on_finished=lambda path: self.play_downloaded(ID, path),
+                              on_progress=self.show_download_progress)
+
+    def play_downloaded(self, ID, audio_file):
+        if len(self.queue) == 0 or self.queue[0].ID != ID:
+            return  # skipped while downloading
+        if self.loaded_id == ID:
+            return  # already playing from the other source
+        self.loaded_id = ID
+        self.play_music(audio_file)
+        if not audio_file.startswith(('http://', 'https://')):
+            self.analyze_loudness([ID])
+
+    def show_download_progress(self, d):
+        self.prefetcher.record_progress(d)
+        if d.get('status') == 'downloading':
+            total = d.get('total_bytes') or d.get('total_bytes_estimate')
+            if total:
+                self.set_title(f"Loading music... {int(d.get('downloaded_bytes', 0) / total * 100)}%")
+
+    def play_music(self, file_path):
+        if self.queue[0].ID == self.preloaded_id:
+            # the standby player already has this song loaded, swapping is gapless. the one swapped out
+            # may still play when the song was picked from a list, preload_next only reloads it if it can
+            if self.player is not self.fading_player and self.player.state() != QMediaPlayer.StoppedState:
+                self.player.stop()
+            self.player, self.next_player = self.next_player, self.player
+            self.preloaded_id = None
+            self.preloaded_path = None
+            metrics.count("gapless_switch")
+            metrics.finish("time_to_first_audio")
+        else:
+            if file_path.startswith(('http://', 'https://')):
+                url = QUrl(file_path)  # streamed, QMediaPlayer fetches byte ranges as it plays and seeks
+            else:
+                url = QUrl.fromLocalFile(file_path)
+            metrics.start("set_media_to_playing")
+            self.player.setMedia(QMediaContent(url))
+            self.player_gain[self.player] = self.engine.gain(self.queue[0].ID)
+        self.set_volume(self.player, self.volume)
+        self.player.play()
+        self.playing = True
+        self.set_title(f"Now playing: {self.queue[0].name}")
+        self.now_playing.emit(self.queue[0].name)
+        self.state_changed.emit()
+        self.buffer_next()
+
+    def preload_next(self):
+        # loads queue[1] into the standby player once it is downloaded
+        if self.fading_player is not None or len(self.queue) < 2:
+            return
+        ID = self.queue[1].ID
+        if ID == self.preloaded_id:
+            return
+        path = self.engine.audio_path(ID)
+        if path is None:
+            return
+        self.next_player.setMedia(QMediaContent(QUrl.fromLocalFile(path)))
+        self.player_gain[self.next_player] = self.engine.gain(ID)
+        self.preloaded_id = ID
+        self.preloaded_path = path
+
+    def media_status_changed(self, player, status):
+        if player is not self.player:
+            return
+        if self.resume_position and status in (QMediaPlayer.LoadedMedia, QMediaPlayer.BufferedMedia):
+            # seeking only works once the restored song is loaded
+            self.player.setPosition(self.resume_position)
+            self.resume_position = 0
+        if status == QMediaPlayer.BufferedMedia:
+            metrics.finish("set_media_to_playing")
+            metrics.finish("time_to_first_audio")
+        elif status == QMediaPlayer.EndOfMedia:
+            self.next_song()
+
+    def position_changed(self, player, position):
+        duration = player.duration()
+        if player is self.player and self.crossfade_ms > 0 and 0 < duration - position <= self.crossfade_ms:
+            self.start_crossfade()
+
+    def play_stop(self):
+        if self.playing:
+            self.player.stop()
+            self.playing = False
+            self.state_changed.emit()
+
+    def play_pause(self):
+        if self.playing:
+            self.player.pause()
+            self.playing = False
+            self.state_changed.emit()
+        elif len(self.queue) > 0:
+            if self.player.state() == QMediaPlayer.StoppedState:
+                self.load_and_play(self.queue[0].ID)
+            else:
+                self.player.play()
+                self.playing = True
+                self.state_changed.emit()
+
+    def start_crossfade(self):
+        # the next song starts under the end of this one, only when it is already preloaded
+        if self.fading_player is not None or len(self.queue) < 2 or self.preloaded_id != self.queue[1].ID:
+            return
+        self.fading_player = self.player
+        self.queue.pop_front()
+        self.loaded_id = self.queue[0].ID
+        self.player, self.next_player = self.next_player, self.player
+        self.preloaded_id = None
+        self.preloaded_path = None
+        self.set_volume(self.player, 0)
+        self.player.play()
+        self.fade_clock.start()
+        self.fade_timer.start()
+        self.set_title(f"Now playing: {self.queue[0].name}")
+        self.now_playing.emit(self.queue[0].name)
+        self.buffer_next()
+
+    def fade_step(self):
+        done = min(1.0, self.fade_clock.elapsed() / self.crossfade_ms)
+        self.set_volume(self.player, self.volume * done)
+        self.set_volume(self.fading_player, self.volume * (1 - done))
+        if done >= 1.0:
+            self.fade_timer.stop()
+            self.fading_player.stop()
+            self.fading_player = None
+            self.preload_next()
+
+    def next_song(self):
+        if self.player.state() != QMediaPlayer.StoppedState:
+            self.player.stop()
+        if len(self.queue) > 0:
+            head = self.engine.skip()
+            self.playing = False
+            self.loaded_id = None
+            metrics.count("skip")
+            self.state_changed.emit()
+            if head is not None:
+                self.load_and_play(head.ID)
+
+    def previous_song(self):
+        if len(self.queue.history) == 0:
+            return
+        if self.player.state() != QMediaPlayer.StoppedState:
+            self.player.stop()
+        self.playing = False
+        self.loaded_id = None
+        self.state_changed.emit()
+        self.load_and_play(self.queue.previous().ID)
+
+    def buffer_next(self):
+        # re-plan which upcoming songs are downloaded in the background
+        if self.buffer_option:
+            self.prefetcher.plan(self.queue)
+        self.preload_next()
+
+    def set_volume(self, player, level):
+        # level is what the user set, turned down for loud songs
+        player.setVolume(int(level * self.player_gain.get(player, 1.0)))
+
+    def change_volume(self, level):
+        self.volume = max(0, min(100, level))
+        self.set_volume(self.player, self.volume)
+
+    def prefetched(self, ID):
+        self.analyze_loudness([ID])
+        self.preload_next()
+
+    def analyze_loudness(self, IDs):
+        if not self.config["normalize_loudness"]:
+            return
+        self.loudness_pending.update(ID for ID in IDs if not self.engine.loudness.analyzed(ID))
+        if self.loudness_pending and not self.loudness_running:
+            self.loudness_timer.start()
+
+    def analyze_pending(self):
+        IDs = [ID for ID in self.loudness_pending if is_local(ID) or self.cache.contains(ID)]
+        self.loudness_pending = set(IDs[self.loudness_chunk:])
+        if IDs:
+            self.loudness_running = True
+            self.run_job(self.engine.analyze_loudness, IDs[:self.loudness_chunk], job_class=BACKGROUND,
+                         on_finished=self.loudness_measured, on_error=self.loudness_failed)
+
+    def loudness_failed(self, message):
+        print(f"loudness analysis failed: {message}")
+        self.loudness_done()
+
+    def loudness_done(self):
+        self.loudness_running = False
+        if self.loudness_pending:
+            self.loudness_timer.start()
+
+    def loudness_measured(self, results):
+        self.loudness_done()
+        # the playing song may have been measured while it plays
+        if len(self.queue) > 0 and self.queue[0].ID in results and self.fading_player is None:
+            self.player_gain[self.player] = self.engine.gain(self.queue[0].ID)
+            self.set_volume(self.player, self.volume)
+        if len(self.queue) > 1 and self.queue[1].ID == self.preloaded_id:
+            self.player_gain[self.next_player] = self.engine.gain(self.preloaded_id)
+
+    def restore_session(self):
+        data = self.engine.session.load()
+        if data is None or not data["queue"]:
+            return
+        self.engine.session.restore(data)
+        if data.get("volume") is not None:
+            self.volume = data["volume"]
+        self.resume_position = data.get("position", 0)
+        self.resume_playing = data.get("playing", False)
+        ID = self.queue[0].ID
+        path = self.engine.audio_path(ID)
+        if path is not None:
+            self.resume(ID, path)
+        else:
+            # evicted or never finished, a .part left by the last session is picked up again
+            self.download_job(ID, PLAY_NOW, on_finished=lambda p: self.resume(ID, p),
+                              on_progress=self.prefetcher.record_progress)
+        self.buffer_next()
+        print(f"resumed session: {len(self.queue)} songs in queue")
+
+    def resume(self, ID, path):
+        # loads the restored queue head, playing only if it was playing when the session was saved
+        if len(self.queue) == 0 or self.queue[0].ID != ID or self.loaded_id is not None:
+            return  # the user started something else meanwhile
+        self.loaded_id = ID
+        self.player.setMedia(QMediaContent(QUrl.fromLocalFile(path)))
+        self.player_gain[self.player] = self.engine.gain(ID)
+        self.set_volume(self.player, self.volume)
+        if self.resume_playing:
+            self.player.play()
+            self.playing = True
+            self.set_title(f"Now playing: {self.queue[0].name}")
+            self.now_playing.emit(self.queue[0].name)
+        else:
+            self.player.pause()  # loaded, play continues from the saved position
+            self.set_title(f"Paused: {self.queue[0].name}")
+        self.state_changed.emit()
+
+    def save_session(self):
+        position = self.resume_position or (self.player.position() if self.loaded_id is not None else 0)
+        try:
+            self.engine.session.save(position, self.playing, self.volume)
+            self.cache.flush()
+            self.engine.backend.flush()
+        except OSError as e:
+            print(f"could not save the session: {e}")
+
+    def shutdown(self):
+        self.save_session()
+        # the pool waits for running jobs when it goes away, downloads stop at their next progress call
+        self.scheduler.cancel_all()
+        self.pool.clear()
+        self.engine.loudness.shutdown()
+        self.pool.waitForDone(2000)
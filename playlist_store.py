@@ -0,0 +1,168 @@
+import os
+import json
+import time
+import sqlite3
+from track import Track
+
+# ranks closer than this get spread out again before the next move
+MIN_RANK_GAP = 1e-9
+# the playlist libraries from before there were several of them become this one
+DEFAULT_PLAYLIST = 1
+
+
+class PlaylistStore:
+    # the playlists in SQLite. songs are ordered by a float rank within their playlist so moving one
+    # song rewrites one row, every change is its own transaction and a crash can never leave half a
+    # file behind. the playlists table is the manifest: names and sizes, read without touching songs
+    def __init__(self, path="library.db", legacy_json="playlist.json"):
+        is_new = not os.path.exists(path)
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        with self.db:
+            self.db.execute("CREATE TABLE IF NOT EXISTS songs (row_id INTEGER PRIMARY KEY, ID TEXT NOT NULL, name TEXT, "
+                            "rank REAL NOT NULL)")
+            # health check results and the playlist, added to libraries made before there were any
+            columns = {row[1] for row in self.db.execute("PRAGMA table_info(songs)")}
+            for column, kind in (("duration", "REAL"), ("checked", "REAL"), ("unavailable", "INTEGER NOT NULL DEFAULT 0"),
+                                 ("playlist", f"INTEGER NOT NULL DEFAULT {DEFAULT_PLAYLIST}")):
+                if column not in columns:
+                    self.db.execute(f"ALTER TABLE songs ADD COLUMN {column} {kind}")
+            self.db.execute("DROP INDEX IF EXISTS songs_rank")  # ranks are per playlist now
+            self.db.execute("CREATE INDEX IF NOT EXISTS songs_playlist_rank ON songs (playlist, rank)")
+            has_manifest = self.db.execute("SELECT 1 FROM sqlite_master WHERE name = 'playlists'").fetchone()
+            if not has_manifest:
+                # the songs of a library from before the manifest are all in the default playlist
+                self.db.execute("CREATE TABLE playlists (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE, "
+                                "size INTEGER NOT NULL DEFAULT 0)")
+                self.db.execute("INSERT INTO playlists (id, name, size) VALUES (?, 'playlist', (SELECT COUNT(*) FROM songs))",
+                                (DEFAULT_PLAYLIST,))
+        if is_new and os.path.exists(legacy_json):
+            self.import_json(legacy_json)
+
+    def import_json(self, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            songs = [Track(song.get("name"), song["ID"]) for song in json.load(f)["songs"] if song.get("ID")]
+        self.append(songs)
+        print(f"imported {len(songs)} songs from {path}")
+
+    def playlists(self):
+        # the manifest, [(id, name, size)] in the order they were made
+        return self.db.execute("SELECT id, name, size FROM playlists ORDER BY id").fetchall()
+
+    def create_playlist(self, name):
+        # returns the new playlist's id, raises sqlite3.IntegrityError when the name is taken
+        with self.db:
+            return self.db.execute("INSERT INTO playlists (name) VALUES (?)", (name,)).lastrowid
+
+    def playlist(self, playlist=DEFAULT_PLAYLIST):
+        return Playlist(self, playlist)
+
+    def count(self, playlist=DEFAULT_PLAYLIST):
+        row = self.db.execute("SELECT size FROM playlists WHERE id = ?", (playlist,)).fetchone()
+        return row[0] if row is not None else 0
+
+    def load(self, offset=0, limit=-1, playlist=DEFAULT_PLAYLIST):
+        rows = self.db.execute("SELECT rowid, ID, name FROM songs WHERE playlist = ? ORDER BY rank LIMIT ? OFFSET ?",
+                               (playlist, limit, offset))
+        return [Track(name, ID, rowid) for rowid, ID, name in rows]
+
+    def append(self, songs, playlist=DEFAULT_PLAYLIST):
+        # one transaction for the whole batch, returns the songs with their rowid set
+        last = self.db.execute("SELECT MAX(rank) FROM songs WHERE playlist = ?", (playlist,)).fetchone()[0] or 0
+        added = []
+        with self.db:
+            for i, song in enumerate(songs):
+                cursor = self.db.execute("INSERT INTO songs (ID, name, rank, playlist) VALUES (?, ?, ?, ?)",
+                                         (song.ID, song.name, last + i + 1, playlist))
+                added.append(Track(song.name, song.ID, cursor.lastrowid))
+            self.db.execute("UPDATE playlists SET size = size + ? WHERE id = ?", (len(added), playlist))
+        return added
+
+    def move(self, rowid, after_rowid):
+        # puts rowid right after after_rowid, or first in its playlist when after_rowid is None
+        playlist = self.db.execute("SELECT playlist FROM songs WHERE rowid = ?", (rowid,)).fetchone()[0]
+        if after_rowid is None:
+            before = None
+            after = self.db.execute("SELECT MIN(rank) FROM songs WHERE playlist = ? AND rowid != ?",
+                                    (playlist, rowid)).fetchone()[0]
+        else:
+            before = self.db.execute("SELECT rank FROM songs WHERE rowid = ?", (after_rowid,)).fetchone()[0]
+            after = self.db.execute("SELECT MIN(rank) FROM songs WHERE playlist = ? AND rank > ? AND rowid != ?",
+                                    (playlist, before, rowid)).fetchone()[0]
+
+        if before is not None and after is not None and after - before < MIN_RANK_GAP:
+            self.spread_ranks(playlist)
+            return self.move(rowid, after_rowid)
+
+        if after is None:
+            rank = 0 if before is None else before + 1
+        elif before is None:
+            rank = after - 1
+        else:
+            rank = (before + after) / 2
+        with self.db:
+            self.db.execute("UPDATE songs SET rank = ? WHERE rowid = ?", (rank, rowid))
+
+    def spread_ranks(self, playlist=DEFAULT_PLAYLIST):
+        with self.db:
+            rows = self.db.execute("SELECT rowid FROM songs WHERE playlist = ? ORDER BY rank", (playlist,)).fetchall()
+            self.db.executemany("UPDATE songs SET rank = ? WHERE rowid = ?",
+                                [(i, rowid) for i, (rowid,) in enumerate(rows)])
+
+    def ids(self):
+        # health and loudness are per song, these are the songs of every playlist
+        return [ID for ID, in self.db.execute("SELECT DISTINCT ID FROM songs")]
+
+    def stale_ids(self, max_age):
+        # IDs never checked or last checked more than max_age seconds ago
+        rows = self.db.execute("SELECT DISTINCT ID FROM songs WHERE checked IS NULL OR checked < ?",
+                               (time.time() - max_age,))
+        return [ID for ID, in rows]
+
+    def unavailable_ids(self):
+        return {ID for ID, in self.db.execute("SELECT DISTINCT ID FROM songs WHERE unavailable")}
+
+    def set_health(self, ID, available, name=None, duration=None):
+        # updates every row of ID, returns them when the title changed
+        with self.db:
+            changed = self.db.execute("SELECT COUNT(*) FROM songs WHERE ID = ? AND name != ?",
+                                      (ID, name)).fetchone()[0] if name else 0
+            self.db.execute("UPDATE songs SET name = COALESCE(?, name), duration = COALESCE(?, duration), "
+                            "checked = ?, unavailable = ? WHERE ID = ?",
+                            (name, duration, time.time(), 0 if available else 1, ID))
+        if not changed:
+            return []
+        rows = self.db.execute("SELECT rowid, ID, name FROM songs WHERE ID = ?", (ID,))
+        return [Track(name, ID, rowid) for rowid, ID, name in rows]
+
+    def remove(self, rowid):
+        with self.db:
+            self.db.execute("UPDATE playlists SET size = size - 1 WHERE id = "
+                            "(SELECT playlist FROM songs WHERE rowid = ?)", (rowid,))
+            self.db.execute("DELETE FROM songs WHERE rowid = ?", (rowid,))
+
+
+class Playlist:
+    # one playlist of a PlaylistStore, what PlaylistModel shows and pages through
+    def __init__(self, store, playlist):
+        self.store = store
+        self.id = playlist
+
+    def count(self):
+        return self.store.count(self.id)
+
+    def load(self, offset=0, limit=-1):
+        return self.store.load(offset, limit, self.id)
+
+    def append(self, songs):
+        return self.store.append(songs, self.id)
+
+    def move(self, rowid, after_rowid):
+        self.store.move(rowid, after_rowid)
+
+    def remove(self, rowid):
+        self.store.remove(rowid)
+
+    def unavailable_ids(self):
+        return self.store.unavailable_ids()
@@ -0,0 +1,72 @@
+import math
+from workers import PREFETCH
+
+# per song readiness
+QUEUED = "queued"
+DOWNLOADING = "downloading"
+READY = "ready"
+FAILED = "failed"
+
+
+class Prefetcher:
+    # keeps the next few queue entries in the audio cache. the number of songs kept ahead
+    # grows when downloads take long compared to how long songs play
+    def __init__(self, cache, scheduler, download_job, min_depth=1, max_depth=5, on_ready=None):
+        self.cache = cache
+        self.scheduler = scheduler
+        self.download_job = download_job  # download_job(ID, job_class, on_finished, on_progress, on_error)
+        self.min_depth = min_depth
+        self.max_depth = max_depth
+        self.on_ready = on_ready  # on_ready(ID) when a prefetched song is in the cache
+        self.states = {}  # ID -> state of songs we were asked to prefetch
+        self.download_seconds = None  # moving averages, None until measured
+        self.song_seconds = None
+
+    def depth(self):
+        if self.download_seconds is None or not self.song_seconds:
+            return self.min_depth
+        # enough songs ahead to cover one download even if the user skips early
+        wanted = self.min_depth + math.ceil(self.download_seconds / self.song_seconds)
+        return max(self.min_depth, min(self.max_depth, wanted))
+
+    def plan(self, queue):
+        # queue[0] is playing, only what comes after it is prefetched
+        wanted = [song.ID for song in queue[1:1 + self.depth()]]
+        self.scheduler.cancel(PREFETCH, keep=[song.ID for song in queue[:1]] + wanted)
+        for ID in list(self.states):
+            if ID not in wanted:
+                del self.states[ID]
+
+        for ID in wanted:
+            if self.cache.contains(ID):
+                self.states[ID] = READY
+            elif self.states.get(ID) != FAILED and not self.scheduler.pending(ID):
+                self.states[ID] = QUEUED
+                self.download_job(ID, PREFETCH, on_finished=lambda path, i=ID: self.set_state(i, READY),
+                                  on_progress=self.record_progress,
+                                  on_error=lambda message, i=ID: self.set_state(i, FAILED))
+
+    def state(self, ID):
+        if self.cache.contains(ID):
+            return READY
+        return self.states.get(ID)
+
+    def set_state(self, ID, state):
+        if ID in self.states:
+            self.states[ID] = state
+        if state == READY and self.on_ready is not None:
+            self.on_ready(ID)
+
+    def record_progress(self, d):
+        info = d.get('info_dict') or {}
+        ID = info.get('id')
+        if d.get('status') == 'downloading':
+            if self.states.get(ID) == QUEUED:
+                self.states[ID] = DOWNLOADING
+        elif d.get('status') == 'finished' and d.get('elapsed'):
+            self.download_seconds = self.average(self.download_seconds, d['elapsed'])
+            if info.get('duration'):
+                self.song_seconds = self.average(self.song_seconds, info['duration'])
+
+    def average(self, old, new):
+        return new if old is None else old * 0.7 + new * 0.3
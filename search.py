@@ -0,0 +1,142 @@
+import re
+import math
+import heapq
+import unicodedata
+
+# grams indexed per title, 2 so that two character CJK queries are found without a scan
+GRAM_SIZES = (2, 3)
+# share of the query's grams a title needs to match at all, below 1 so typos still find it
+MIN_MATCH = 0.6
+
+spaces = re.compile(r'\s+')
+
+
+def normalize(text):
+    # NFKC folds full width latin and half width kana to their usual forms, casefold does the rest
+    return spaces.sub(' ', unicodedata.normalize('NFKC', text or '').casefold()).strip()
+
+
+def grams(text):
+    found = set()
+    for n in GRAM_SIZES:
+        for i in range(len(text) - n + 1):
+            found.add(text[i:i + n])
+    return found
+
+
+class TitleIndex:
+    # n-gram index over song titles. keys are whatever identifies a song to the caller
+    # (playlist rowid, queue ID); adding a key again replaces its title
+    def __init__(self):
+        self.titles = {}  # key -> (normalized title, song)
+        self.postings = {}  # gram -> set of keys
+
+    def __len__(self):
+        return len(self.titles)
+
+    def add(self, key, song):
+        if key in self.titles:
+            self.remove(key)
+        title = normalize(song.name)
+        self.titles[key] = (title, song)
+        for gram in grams(title):
+            self.postings.setdefault(gram, set()).add(key)
+
+    def add_songs(self, songs, key="rowid"):
+        for song in songs:
+            self.add(getattr(song, key), song)
+
+    def remove(self, key):
+        entry = self.titles.pop(key, None)
+        if entry is None:
+            return
+        for gram in grams(entry[0]):
+            keys = self.postings.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.postings[gram]
+
+    def clear(self):
+        self.titles = {}
+        self.postings = {}
+
+    def search(self, query, limit=50):
+        # [(score, key, song)] best first. titles containing the query rank above fuzzy matches,
+        # titles starting with it above those, shorter titles first among equals
+        query = normalize(query)
+        if not query:
+            return []
+        if len(query) < min(GRAM_SIZES):
+            candidates = {key: 1 for key, (title, _) in self.titles.items() if query in title}
+            wanted = 1
+        else:
+            # rarest grams first. a title matching enough grams has to contain one of the first
+            # len - needed + 1 of them, the common grams after that only count for known candidates
+            postings = sorted((self.postings.get(gram, ()) for gram in grams(query)), key=len)
+            wanted = len(postings)
+            seeds = wanted - math.ceil(wanted * MIN_MATCH) + 1
+            candidates = {}
+            for keys in postings[:seeds]:
+                for key in keys:
+                    candidates[key] = candidates.get(key, 0) + 1
+            for keys in postings[seeds:]:
+                if len(keys) < len(candidates):
+                    for key in keys:
+                        if key in candidates:
+                            candidates[key] += 1
+                else:
+                    for key in candidates:
+                        if key in keys:
+                            candidates[key] += 1
+        results = []
+        for key, matched in candidates.items():
+            if matched < math.ceil(wanted * MIN_MATCH):
+                continue
+            title, song = self.titles[key]
+            score = matched / wanted
+            if matched == wanted and query in title:  # containing the query means matching every gram
+                score += 1 + (title.startswith(query) * 0.5)
+            results.append((score, -len(title), key, song))
+        results = heapq.nlargest(limit, results, key=lambda r: (r[0], r[1]))
+        return [(score, key, song) for score, _, key, song in results]
+
+
+class QueueIndex(TitleIndex):
+    # keeps itself in step with a TrackQueue as its listener, keyed by ID
+    def __init__(self, queue):
+        super().__init__()
+        self.queue = queue
+        self.pending = []  # the rows or songs of the change being made
+        self.add_songs(queue, "ID")
+        queue.add_listener(self)
+
+    def about_to_insert(self, first, last):
+        self.pending = (first, last)
+
+    def inserted(self):
+        first, last = self.pending
+        self.add_songs(self.queue[first:last + 1], "ID")
+        self.pending = []
+
+    def about_to_remove(self, first, last):
+        self.pending = self.queue[first:last + 1]
+
+    def removed(self):
+        for song in self.pending:
+            if not self.queue.contains(song.ID):
+                self.remove(song.ID)
+        self.pending = []
+
+    def about_to_move(self, row, to):
+        pass
+
+    def moved(self):
+        pass
+
+    def about_to_reset(self):
+        pass
+
+    def reset(self):
+        self.clear()
+        self.add_songs(self.queue, "ID")
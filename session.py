@@ -0,0 +1,73 @@
+import os
+import json
+import time
+from track import Track
+
+
+class Session:
+    # the queue, the history, where the current song was and the volume, saved every few seconds
+    # and on exit so the next start picks up where this one stopped. the cache index keeps the
+    # audio itself, so the current song is usually on disk already.
+    # a listener of the queue, the songs are only encoded again after the queue changed
+    def __init__(self, path, queue):
+        self.path = path
+        self.queue = queue
+        self.encoded = None  # the queue and history as written last time, None when they changed since
+        queue.add_listener(self)
+
+    def load(self):
+        # {"queue", "history", "position", "playing", "volume"} with Tracks, None without a session
+        if not self.path or not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            data["queue"] = [Track(name, ID) for ID, name in data["queue"]]
+            data["history"] = [Track(name, ID) for ID, name in data["history"]]
+        except (ValueError, KeyError, TypeError):
+            print("saved session is broken, starting empty...")
+            return None
+        return data
+
+    def restore(self, data):
+        self.queue.replace(data["queue"])
+        self.queue.history.extend(data["history"])
+        self.encoded = None
+
+    def save(self, position=0, playing=False, volume=None):
+        if not self.path:
+            return
+        if self.encoded is None:
+            self.encoded = (json.dumps([[song.ID, song.name] for song in self.queue], ensure_ascii=False),
+                            json.dumps([[song.ID, song.name] for song in self.queue.history], ensure_ascii=False))
+        songs, history = self.encoded
+        # the song lists are pasted in as they are, only the rest changes from save to save
+        rest = json.dumps({"saved": time.time(), "position": position, "playing": playing, "volume": volume})
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(f'{{"queue": {songs}, "history": {history}, {rest[1:]}')
+        os.replace(tmp_path, self.path)
+
+    def about_to_insert(self, first, last):
+        pass
+
+    def inserted(self):
+        self.encoded = None
+
+    def about_to_remove(self, first, last):
+        pass
+
+    def removed(self):
+        self.encoded = None
+
+    def about_to_move(self, row, to):
+        pass
+
+    def moved(self):
+        self.encoded = None
+
+    def about_to_reset(self):
+        pass
+
+    def reset(self):
+        self.encoded = None
@@ -0,0 +1,15 @@
+import sys
+
+
+class Track:
+    # one song of the queue or the playlist, only what the player uses. the yt-dlp info is never
+    # kept here, IDs are interned so the queue, the playlist and the caches share one string each
+    __slots__ = ('name', 'ID', 'rowid')
+
+    def __init__(self, name, ID, rowid=None):
+        self.name = name or ''
+        self.ID = sys.intern(ID)
+        self.rowid = rowid  # row in the playlist store, None for songs that are not in it
+
+    def __repr__(self):
+        return f"Track({self.name!r}, {self.ID!r}, {self.rowid!r})"
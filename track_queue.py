@@ -0,0 +1,181 @@
+import random
+from collections import deque
+
+# how many free slots are made in front of the queue when it has none left
+FRONT_SLACK = 64
+# the dead space in front of the head is dropped once it is this large and half of the list
+COMPACT_AT = 1024
+
+
+class TrackQueue:
+    # the play queue, queue[0] is the song playing. songs live in a list with free space in front
+    # of the head, so popping the played song and putting one in front are O(1) amortized
+    # and indexing stays O(1). an ID -> count index answers "is this queued" without a scan, finding
+    # where a song is (index_of) is a scan that stops at the first copy, removing every copy of an ID is one
+    # scan, and moving or removing past the head is a list edit.
+    # positions for those are 0 <= i < len, negative ones are not counted from the end
+    # listeners get told about every change the way Qt item models expect it:
+    # about_to_<change>(...) before and <change>() after
+    def __init__(self, history_size=100):
+        self.items = []
+        self.head = 0
+        self.counts = {}  # ID -> how often it is queued
+        self.history = deque(maxlen=history_size)  # played songs, newest last
+        self.listeners = []
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def notify(self, change, *args):
+        for listener in self.listeners:
+            getattr(listener, change)(*args)
+
+    def __len__(self):
+        return len(self.items) - self.head
+
+    def __iter__(self):
+        for i in range(self.head, len(self.items)):
+            yield self.items[i]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.items[self.head + j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("queue index out of range")
+        return self.items[self.head + i]
+
+    def contains(self, ID):
+        return self.counts.get(ID, 0) > 0
+
+    def index_of(self, ID):
+        if not self.contains(ID):
+            return -1
+        for i in range(len(self)):
+            if self.items[self.head + i].ID == ID:
+                return i
+        return -1
+
+    def count(self, song, n):
+        self.counts[song.ID] = self.counts.get(song.ID, 0) + n
+        if self.counts[song.ID] <= 0:
+            del self.counts[song.ID]
+
+    def append(self, song):
+        self.extend([song])
+
+    def extend(self, songs):
+        if not songs:
+            return
+        first = len(self)
+        self.notify('about_to_insert', first, first + len(songs) - 1)
+        self.items.extend(songs)
+        for song in songs:
+            self.count(song, 1)
+        self.notify('inserted')
+
+    def push_front(self, song):
+        self.notify('about_to_insert', 0, 0)
+        if self.head == 0:
+            slack = max(FRONT_SLACK, len(self))
+            self.items[0:0] = [None] * slack
+            self.head = slack
+        self.head -= 1
+        self.items[self.head] = song
+        self.count(song, 1)
+        self.notify('inserted')
+
+    def insert(self, i, song):
+        if i <= 0:
+            self.push_front(song)
+        elif i >= len(self):
+            self.append(song)
+        else:
+            self.notify('about_to_insert', i, i)
+            self.items.insert(self.head + i, song)
+            self.count(song, 1)
+            self.notify('inserted')
+
+    def pop_front(self):
+        # the played song goes to the history for previous()
+        song = self.remove_at(0)
+        self.history.append(song)
+        return song
+
+    def previous(self):
+        # puts the last played song back in front, returns it or None
+        if not self.history:
+            return None
+        song = self.history.pop()
+        self.push_front(song)
+        return song
+
+    def check_index(self, i):
+        if not 0 <= i < len(self):
+            raise IndexError("queue index out of range")
+
+    def remove_at(self, i):
+        self.check_index(i)
+        song = self[i]
+        self.notify('about_to_remove', i, i)
+        if i == 0:
+            self.items[self.head] = None
+            self.head += 1
+            if self.head >= COMPACT_AT and self.head * 2 >= len(self.items):
+                del self.items[:self.head]
+                self.head = 0
+        else:
+            del self.items[self.head + i]
+        self.count(song, -1)
+        self.notify('removed')
+        return song
+
+    def remove_id(self, ID):
+        # one scan whatever the number of copies, listeners get a single row removal or a single reset
+        n = self.counts.get(ID, 0)
+        if n == 1:
+            self.remove_at(self.index_of(ID))
+        elif n > 1:
+            self.replace([song for song in self if song.ID != ID])
+
+    def move(self, i, to):
+        self.check_index(i)
+        if i == to or not 0 <= to < len(self):
+            return
+        song = self[i]
+        self.notify('about_to_move', i, to)
+        del self.items[self.head + i]
+        self.items.insert(self.head + to, song)
+        self.notify('moved')
+
+    def shuffle(self, keep_first=True):
+        # keeps the playing song where it is
+        first = 1 if keep_first else 0
+        rest = self[first:]
+        random.shuffle(rest)
+        self.replace(self[:first] + rest)
+
+    def dedupe(self):
+        # drops every repeat of a song, the first time it is queued stays
+        if len(self.counts) == len(self):
+            return
+        seen = set()
+        songs = []
+        for song in self:
+            if song.ID not in seen:
+                seen.add(song.ID)
+                songs.append(song)
+        self.replace(songs)
+
+    def clear(self):
+        self.replace([])
+
+    def replace(self, songs):
+        self.notify('about_to_reset')
+        self.items = list(songs)
+        self.head = 0
+        self.counts = {}
+        for song in self.items:
+            self.count(song, 1)
+        self.notify('reset')
@@ -0,0 +1,129 @@
+import traceback
+from collections import deque
+from PyQt5.QtCore import QObject, QRunnable, pyqtSignal
+
+# job classes, lower runs first
+PLAY_NOW = 0
+STREAM = 1  # resolving the stream url of the song to play, kept apart since it cannot be cancelled
+PREFETCH = 2
+BACKGROUND = 3
+JOB_CLASSES = {"play": PLAY_NOW, "stream": STREAM, "prefetch": PREFETCH, "background": BACKGROUND}
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class WorkerSignals(QObject):
+    # created on the GUI thread, so connected slots run there
+    finished = pyqtSignal(object)
+    error = pyqtSignal(str)
+    progress = pyqtSignal(object)
+    done = pyqtSignal()  # always emitted last, also after errors and cancellation
+
+
+class Job(QRunnable):
+    # runs func(*args, **kwargs) on a QThreadPool thread and reports back through signals.
+    # with report_progress=True func also gets a progress= callback it can call with any object,
+    # calling it after cancel() raises JobCancelled so long downloads stop early
+    def __init__(self, func, *args, report_progress=False, key=None, **kwargs):
+        super().__init__()
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.key = key
+        self.job_class = BACKGROUND
+        self.cancelled = False
+        self.signals = WorkerSignals()
+        if report_progress:
+            self.kwargs['progress'] = self.report_progress
+
+    def cancel(self):
+        self.cancelled = True
+
+    def report_progress(self, value):
+        if self.cancelled:
+            raise JobCancelled()
+        self.signals.progress.emit(value)
+
+    def run(self):
+        try:
+            if self.cancelled:
+                raise JobCancelled()
+            result = self.func(*self.args, **self.kwargs)
+        except Exception as e:
+            # yt-dlp may wrap our exception, the flag is what counts
+            if not self.cancelled:
+                traceback.print_exc()
+                self.signals.error.emit(str(e))
+        else:
+            if not self.cancelled:
+                self.signals.finished.emit(result)
+        finally:
+            self.signals.done.emit()
+
+
+class Scheduler(QObject):
+    # hands jobs to the pool by class, each class has its own concurrency limit
+    # so prefetch and bulk work can never hold up the song the user wants now
+    def __init__(self, pool, limits, parent=None):
+        super().__init__(parent)
+        self.pool = pool
+        # a class missing from limits, e.g. in an older config.json, runs one job at a time
+        self.limits = {job_class: limits.get(name, 1) for name, job_class in JOB_CLASSES.items()}
+        self.waiting = {job_class: deque() for job_class in self.limits}
+        self.running = {job_class: set() for job_class in self.limits}
+        self.pool.setMaxThreadCount(sum(self.limits.values()))
+
+    def submit(self, job, job_class):
+        job.job_class = job_class
+        job.signals.done.connect(lambda: self.job_done(job))
+        self.waiting[job_class].append(job)
+        self.dispatch()
+
+    def dispatch(self):
+        for job_class in sorted(self.waiting):
+            waiting = self.waiting[job_class]
+            while waiting and len(self.running[job_class]) < self.limits[job_class]:
+                job = waiting.popleft()
+                self.running[job_class].add(job)
+                self.pool.start(job, len(self.limits) - job_class)
+
+    def job_done(self, job):
+        self.running[job.job_class].discard(job)
+        self.dispatch()
+
+    def pending(self, key, job_class=None):
+        for c in self.waiting:
+            if job_class is None or c == job_class:
+                for job in list(self.waiting[c]) + list(self.running[c]):
+                    if job.key == key and not job.cancelled:
+                        return True
+        return False
+
+    def cancel(self, job_class, keep=(), only=None):
+        # drops waiting jobs and stops running ones of job_class whose key is not in keep, and is in
+        # only when given. jobs without a key (extraction for button clicks) are never obsolete
+        def obsolete(job):
+            return job.key is not None and job.key not in keep and (only is None or job.key in only)
+
+        waiting = self.waiting[job_class]
+        for job in list(waiting):
+            if obsolete(job):
+                waiting.remove(job)
+                job.cancel()
+                job.signals.done.emit()
+        for job in list(self.running[job_class]):
+            if obsolete(job):
+                job.cancel()
+
+    def cancel_all(self):
+        # on exit: nothing waiting starts anymore and every running job stops at its next progress call,
+        # jobs without a key included
+        for job_class in self.waiting:
+            waiting, self.waiting[job_class] = self.waiting[job_class], deque()
+            for job in waiting:
+                job.cancel()
+        for job_class in self.running:
+            for job in self.running[job_class]:
+                job.cancel()